@@ -1,72 +1,344 @@
-from flask import Flask, jsonify, request
+from flask import Flask, abort, jsonify, request
 from flask_cors import CORS
-from flask_caching import Cache
+import click
 import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 from urllib.parse import unquote
 
-from main import get_app_data, AppData
+from main import expire_searches, get_app_data, narrative_index, prune_stages, stage_store, AppData
+from json_response import PreparedJSON, prepare_json, send_prepared
+from result_cache import ResultCache
+from single_flight import SingleFlight
+from statement_extractor import video_id_from_url
+from evidence_packer import packing_report
+from profiling import profiled
+from provenance_graph import RANKINGS, ProvenanceGraph
+from fact_checker import cascade_report
+from cost_estimator import estimate_batch, estimate_video
 
 app = Flask(__name__)
 CORS(app)
 
-app_data: AppData = None
 
-# Configure cache
-# ma
-cache_dir = os.path.join(os.path.dirname(__file__), 'cache')
-os.makedirs(cache_dir, exist_ok=True)
+@dataclass
+class PreparedAppData:
+    misinformation: PreparedJSON
+    statements: List[PreparedJSON]
+    provenance: List[PreparedJSON]
+    video_url: PreparedJSON
+    title: PreparedJSON
+    # indexed adjacency for paginated /provenance queries (None in entries cached before it existed)
+    provenance_graphs: Optional[List[ProvenanceGraph]] = None
+
+
+def prepare_app_data(data: AppData) -> PreparedAppData:
+    """Serializes every endpoint payload for a finished analysis once."""
+    return PreparedAppData(
+        misinformation=prepare_json(data.misinformation_graph),
+        statements=[prepare_json(g) for g in data.statement_graphs],
+        provenance=[prepare_json(d) for d in data.article_dagraph],
+        video_url=prepare_json({"url": data.url}),
+        title=prepare_json({"header": "YouTube Video Analysis"}),
+        provenance_graphs=[ProvenanceGraph.from_dag(d) for d in data.article_dagraph]
+    )
 
-# Stores results of functions in filesystem for 5 minutes
-cache = Cache(app, config={
-    'CACHE_TYPE': 'filesystem',
-    'CACHE_DIR': cache_dir,
-    'CACHE_DEFAULT_TIMEOUT': 300  # 5 minutes
-})
 
 #set open ai key
 load_dotenv()  # load .env file
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Configure cache: in-memory LRU over a size-capped disk tier, keyed by video id
+cache_dir = os.path.join(os.path.dirname(__file__), 'cache')
+result_cache = ResultCache(
+    cache_dir,
+    max_memory_items=int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "16")),
+    max_disk_bytes=int(os.getenv("RESULT_CACHE_DISK_MB", "256")) * 1024 * 1024
+)
+
+# Pull the most requested videos back into memory in every process that loads the app
+# (flask run, gunicorn workers...), in the background so startup isn't held up
+threading.Thread(target=result_cache.warm, name="cache-warm-up", daemon=True).start()
+
+# Concurrent requests for the same video share one pipeline run, across workers too
+single_flight = SingleFlight(os.path.join(cache_dir, "leases.sqlite3"))
+
+# Video whose results the level 2/3 endpoints serve when no ?video= is given
+current_video: str = None
+
+# Deadline-bounded (partial) results are cached under their own key, so they only ever
+# answer requests that have a deadline themselves (and level 2/3 reads until the full one lands)
+PARTIAL_SUFFIX = ":partial"
+
+EMPTY_VIDEO_URL = prepare_json({"url": ""})
+EMPTY_TITLE = prepare_json({"header": ""})
+
+
+def load_app_data(youtube_url: str, endpoint: str, deadline: Optional[float] = None, continue_partial: bool = True, profile: bool = False) -> Tuple[AppData, PreparedAppData]:
+    started = time.monotonic()
+    video_id = video_id_from_url(youtube_url)
+    partial_key = video_id + PARTIAL_SUFFIX
+    result_cache.touch(video_id)
+    cached = result_cache.get(video_id, endpoint, fallback=partial_key if deadline is not None else None)
+    if cached is None:
+        def compute():
+            remaining = None if deadline is None else max(0.0, deadline - (time.monotonic() - started))
+            with profiled(video_id, enabled=profile):
+                data = get_app_data(youtube_url, remaining)
+            result = (data, prepare_app_data(data))
+            if data.partial:
+                result_cache.set(partial_key, result)
+                if continue_partial:
+                    continue_analysis(youtube_url)
+            else:
+                result_cache.set(video_id, result)
+                result_cache.invalidate(partial_key)
+            return result
+
+        full_lookup = lambda: result_cache.peek(video_id)
+        partial_lookup = lambda: result_cache.peek(video_id) or result_cache.peek(partial_key)
+        if deadline is None:
+            # a deadline-bounded run of the same video answers us if it finishes, otherwise
+            # the do() below shares the run with the background continuation it started
+            joined = single_flight.wait(partial_key, partial_lookup)
+            if joined is not None and not joined[0].partial:
+                return joined
+            cached = single_flight.do(video_id, compute, full_lookup)
+        else:
+            # a full run that is already going gets half the deadline to finish, the rest is ours
+            cached = single_flight.wait(video_id, full_lookup, timeout=deadline / 2)
+            if cached is None:
+                cached = single_flight.do(partial_key, compute, partial_lookup)
+    return cached
+
+
+def continue_analysis(youtube_url: str):
+    """Finishes a deadline-bounded analysis in the background and replaces the partial result."""
+    video_id = video_id_from_url(youtube_url)
+
+    def compute():
+        data = get_app_data(youtube_url)
+        result = (data, prepare_app_data(data))
+        result_cache.set(video_id, result)
+        result_cache.invalidate(video_id + PARTIAL_SUFFIX)
+        return result
+
+    def run():
+        try:
+            single_flight.do(video_id, compute, lambda: result_cache.peek(video_id))
+        except Exception as e:
+            print(f"Background analysis of {video_id} failed: {e}")
+            # don't keep serving the partial result as if it were going to be completed
+            result_cache.invalidate(video_id + PARTIAL_SUFFIX)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def cached_app_data(endpoint: str) -> Optional[Tuple[AppData, PreparedAppData]]:
+    video_id = request.args.get("video", current_video)
+    if video_id is None:
+        return None
+    return result_cache.get(video_id, endpoint, fallback=video_id + PARTIAL_SUFFIX)
+
+
+def invalidate_video(video_id: Optional[str]):
+    """Drops a video's full and partial results, or everything if no id is given."""
+    result_cache.invalidate(video_id)
+    if video_id is not None:
+        result_cache.invalidate(video_id + PARTIAL_SUFFIX)
+
 
 #VIDEO LINK ENDPOINT
 @app.route('/misinformation/<path:youtube_url>')
-@cache.cached(timeout=0)  # cache indefinitely - results won't change for same video
 def get_misinformation(youtube_url: str):  
-    global app_data
+    global current_video
     decoded_url = unquote(youtube_url)
-    app_data = get_app_data(decoded_url)
-    return jsonify(app_data.misinformation_graph)
+    # optional latency budget in seconds; partial results are completed in the background
+    deadline = request.args.get("deadline", type=float)
+    continue_partial = request.args.get("continue", "1") != "0"
+    # profile this run (only a cache miss runs the pipeline, combine with refresh=1 to force one)
+    profile = request.headers.get("X-Profile") == "1" or request.args.get("profile") == "1"
+    if request.args.get("refresh") in ("1", "searches"):
+        # re-run the pipeline; the stage store recomputes only stale stages
+        # (refresh=searches also expires the video's search results first)
+        if request.args.get("refresh") == "searches":
+            expire_searches(video_id_from_url(decoded_url))
+        invalidate_video(video_id_from_url(decoded_url))
+    # results won't change for same video, so they are cached until invalidated
+    _, prepared = load_app_data(decoded_url, "misinformation", deadline, continue_partial, profile)
+    current_video = video_id_from_url(decoded_url)
+    return send_prepared(prepared.misinformation)
 
 
 #LEVEL 2 ENDPOINT
 @app.route("/statement/<int:misinformation_id>")
-@cache.cached(timeout=0)
 def get_statements(misinformation_id: int):
-    return jsonify(app_data.statement_graphs[misinformation_id])
+    cached = cached_app_data("statement")
+    if cached is None or misinformation_id >= len(cached[1].statements):
+        abort(404)
+    return send_prepared(cached[1].statements[misinformation_id])
 
 #LEVEL 3 ENDPOINT
 @app.route("/provenance/<int:statement_id>")
-@cache.cached(timeout=0)
 def get_provenance(statement_id: int):
-    return jsonify(app_data.article_dagraph[statement_id])
+    cached = cached_app_data("provenance")
+    if cached is None or statement_id >= len(cached[1].provenance):
+        abort(404)
+
+    # without query parameters the whole DAG is served, as before
+    args = request.args
+    if not any(name in args for name in ("offset", "limit", "k", "around")):
+        return send_prepared(cached[1].provenance[statement_id])
+
+    data, prepared = cached
+    graphs = prepared.provenance_graphs
+    graph = graphs[statement_id] if graphs is not None else ProvenanceGraph.from_dag(data.article_dagraph[statement_id])
+    rank = args.get("rank", "severity")
+    if rank not in RANKINGS:
+        abort(400)
+    k = args.get("k", type=int)
+    limit = args.get("limit", 50, type=int)
+
+    if "around" in args:
+        result = graph.expand(args.get("around", type=int), args.get("depth", 1, type=int), k, rank, limit)
+        if result is None:
+            abort(404)
+    else:
+        result = graph.page(args.get("offset", 0, type=int), limit, k, rank)
+    return send_prepared(prepare_json(result))
 
 
 #metadata endpoints
 @app.route("/video_url")
-@cache.cached(timeout=0)
 def get_video_url():
-    if app_data:
-        return jsonify({"url": app_data.url})
-    return jsonify({"url": ""})
+    cached = cached_app_data("video_url")
+    if cached:
+        return send_prepared(cached[1].video_url)
+    return send_prepared(EMPTY_VIDEO_URL)
 
 
 @app.route("/lvl_2_title")
-@cache.cached(timeout=0)
 def get_title():
-    if app_data:
-        return jsonify({"header": "YouTube Video Analysis"})
-    return jsonify({"header": ""})
+    cached = cached_app_data("lvl_2_title")
+    if cached:
+        return send_prepared(cached[1].title)
+    return send_prepared(EMPTY_TITLE)
+
+
+#corpus-wide narrative endpoints
+@app.route("/narratives")
+def get_narratives():
+    return jsonify(narrative_index().narratives(request.args.get("limit", 50, type=int)))
+
+
+@app.route("/narratives/<int:narrative_id>")
+def get_narrative_statements(narrative_id: int):
+    members = narrative_index().statements(
+        narrative_id,
+        limit=request.args.get("limit", 100, type=int),
+        after_id=request.args.get("after", 0, type=int)
+    )
+    return jsonify({
+        "statements": [asdict(m) for m in members],
+        "next": members[-1].member_id if members else None
+    })
+
+
+#cache management
+@app.route("/cache/stats")
+def get_cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route("/tokens/stats")
+def get_token_stats():
+    return jsonify(packing_report())
+
+
+@app.route("/cascade/stats")
+def get_cascade_stats():
+    # ?scope=worker reports only this worker's counts since it started
+    return jsonify(cascade_report(None if request.args.get("scope") == "worker" else stage_store()))
+
+
+#dry run: what analysing a video would cost, fetching only its transcript
+@app.route("/estimate/<path:youtube_url>")
+def get_estimate(youtube_url: str):
+    estimate = estimate_video(unquote(youtube_url))
+    if estimate is None:
+        abort(404)
+    return jsonify(estimate.to_dict())
+
+
+@app.route("/cache/<video_id>", methods=["DELETE"])
+def invalidate_cache(video_id: str):
+    global current_video
+    invalidate_video(video_id)
+    if video_id == current_video:
+        current_video = None
+    return "", 204
+
+
+@app.cli.command("warm-cache")
+@click.argument("urls", nargs=-1)
+def warm_cache_command(urls):
+    """Analyses any given URLs that are not cached yet, so every worker can serve them from disk."""
+    for url in urls:
+        load_app_data(url, "warm-cache")
+    print(f"Cached: {[video_id_from_url(url) for url in urls]}")
+
+
+@app.cli.command("refresh")
+@click.argument("urls", nargs=-1)
+@click.option("--profile", is_flag=True, help="Write a cProfile dump and collapsed-stack flamegraph per video")
+@click.option("--searches", is_flag=True, help="Expire the videos' search results even if they are younger than a day")
+def refresh_command(urls, profile, searches):
+    """Re-analyses videos, recomputing only the pipeline stages that went stale."""
+    for url in urls:
+        if searches:
+            expire_searches(video_id_from_url(url))
+        invalidate_video(video_id_from_url(url))
+        load_app_data(url, "refresh", profile=profile)
+
+
+@app.cli.command("estimate")
+@click.argument("urls", nargs=-1)
+def estimate_command(urls):
+    """Estimates LLM calls, searches, tokens and wall time for analysing videos, without analysing them."""
+    batch = estimate_batch(list(urls))
+    for video in batch["videos"]:
+        print(video["url"])
+        for stage, estimate in {**video["stages"], "total": video["total"]}.items():
+            print(f"  {stage:<14}{estimate['llm_calls']:>8.1f} calls{estimate['search_calls']:>8.1f} searches"
+                  f"{estimate['tokens']:>10.0f} tokens{estimate['seconds']:>8.0f}s{'  (cached)' if estimate['cached'] else ''}")
+    for url in batch["skipped"]:
+        print(f"{url}: no transcript, skipped")
+    total = batch["total"]
+    print(f"Batch: {total['llm_calls']:.0f} LLM calls, {total['search_calls']:.0f} search requests, "
+          f"{total['tokens']:.0f} tokens, ~{total['seconds'] / 60:.1f} min sequential")
+
+
+@app.cli.command("prune-stages")
+def prune_stages_command():
+    """Deletes expired stage outputs (e.g. day-old search results) from the stage store."""
+    print(f"Deleted {prune_stages(force=True)} expired stage outputs")
+
+
+@app.cli.command("compact-narratives")
+def compact_narratives_command():
+    """Merges corpus narratives whose centroids have drifted together."""
+    print(f"Merged {narrative_index().compact()} narratives")
+
+
+@app.cli.command("invalidate-cache")
+@click.argument("video_ids", nargs=-1)
+def invalidate_cache_command(video_ids):
+    """Drops the given videos from the cache, or everything if none are given."""
+    for video_id in video_ids or [None]:
+        invalidate_video(video_id)
 
 
 if __name__ == '__main__':
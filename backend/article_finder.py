@@ -1,10 +1,11 @@
 import argparse
-import requests
 import re
 import os
+import time
 from datetime import datetime
 from dataclasses import dataclass
 from dotenv import load_dotenv
+from call_stats import record_call
 
 load_dotenv()
 
@@ -34,7 +35,9 @@ def extract_date_from_snippet(snippet):
     
     return ""
 
-def find_articles(statement, num_results=20, before_date=None):
+def find_articles(statement, num_results=20, before_date=None, raise_errors=False):
+    import requests
+
     base_url = "https://www.googleapis.com/customsearch/v1"
     articles = []
     results_per_page = 10  # Google's max per request
@@ -53,7 +56,9 @@ def find_articles(statement, num_results=20, before_date=None):
             params['sort'] = 'date:r:1970:' + before_date.strftime('%Y%m%d')
         
         try:
+            started = time.perf_counter()
             response = requests.get(base_url, params=params)
+            record_call("search", "google", time.perf_counter() - started)
             response.raise_for_status()
             results = response.json()
             
@@ -83,6 +88,9 @@ def find_articles(statement, num_results=20, before_date=None):
                     break
                     
         except Exception as e:
+            # callers that store the results need to know they are incomplete
+            if raise_errors:
+                raise
             print(f"Error on page {page+1}: {e}")
             break
     
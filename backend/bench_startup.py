@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+"""
+Cold start benchmark for the backend service.
+
+Imports `app` in fresh interpreters and reports wall-clock import time and peak RSS.
+It also checks that none of the heavy pipeline dependencies were pulled in at import
+time, since those should only load on first use in the stage that needs them.
+Exits non-zero when any threshold is exceeded so it can gate CI or worker images.
+"""
+
+HEAVY_MODULES = ["sklearn", "matplotlib", "scipy", "openai", "wikipedia", "youtube_transcript_api", "requests", "langchain_core", "langchain_openai"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024  # macOS reports bytes
+heavy = sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss_kb / 1024, "heavy": heavy}}))
+"""
+
+
+def measure(module: str, runs: int) -> list:
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=backend_dir, capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure backend cold start time and memory')
+    parser.add_argument('--module', default='app', help='Module to import (default: app)')
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters to sample')
+    parser.add_argument('--max-seconds', type=float, default=1.0, help='Fail if median import time exceeds this')
+    parser.add_argument('--max-rss-mb', type=float, default=150.0, help='Fail if peak RSS exceeds this')
+    args = parser.parse_args()
+
+    samples = measure(args.module, args.runs)
+    times = sorted(s["seconds"] for s in samples)
+    median = times[len(times) // 2]
+    rss = max(s["rss_mb"] for s in samples)
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+
+    print(f"import {args.module}: median {median * 1000:.0f} ms (min {times[0] * 1000:.0f}, max {times[-1] * 1000:.0f}) over {args.runs} runs")
+    print(f"peak RSS: {rss:.1f} MB")
+    print(f"heavy modules loaded at import: {', '.join(heavy) if heavy else 'none'}")
+
+    failures = []
+    if median > args.max_seconds:
+        failures.append(f"import time {median:.3f}s > {args.max_seconds}s")
+    if rss > args.max_rss_mb:
+        failures.append(f"RSS {rss:.1f} MB > {args.max_rss_mb} MB")
+    if heavy:
+        failures.append(f"eagerly imported: {', '.join(heavy)}")
+
+    if failures:
+        print("REGRESSION: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
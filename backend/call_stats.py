@@ -0,0 +1,48 @@
+from collections import defaultdict
+from typing import Dict, Tuple
+import threading
+
+"""
+Latency of every external call the pipeline makes, by stage and model, and how the
+verification cascade routed claims.
+
+Pipeline modules report each OpenAI and search request with record_call(stage, model,
+seconds) and each cascade decision with record_route(route). Both are accumulated in
+memory and drained once per analysis into the stage store (StageStore.record_calls and
+record_routes), so the history survives restarts and is shared by all workers, e.g. for
+the cost estimator and /cascade/stats.
+"""
+
+_lock = threading.Lock()
+# (stage, model) -> [calls, seconds]
+_pending: Dict[Tuple[str, str], list] = defaultdict(lambda: [0, 0.0])
+# route -> claims
+_pending_routes: Dict[str, int] = defaultdict(int)
+
+
+def record_call(stage: str, model: str, seconds: float):
+    with _lock:
+        entry = _pending[(stage, model)]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def drain() -> Dict[Tuple[str, str], Tuple[int, float]]:
+    """Returns the timings gathered since the last drain and resets them."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(lambda: [0, 0.0])
+    return {key: (calls, seconds) for key, (calls, seconds) in pending.items()}
+
+
+def record_route(route: str):
+    with _lock:
+        _pending_routes[route] += 1
+
+
+def drain_routes() -> Dict[str, int]:
+    """Returns the cascade routes counted since the last drain and resets them."""
+    global _pending_routes
+    with _lock:
+        pending, _pending_routes = _pending_routes, defaultdict(int)
+    return dict(pending)
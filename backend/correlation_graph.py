@@ -1,16 +1,17 @@
 from article_finder import Article
+from evidence_packer import pack_text, token_budget
+from call_stats import record_call
 
-import openai
 from dotenv import load_dotenv
-import os
 import json
-from openai import OpenAI
-from typing import List
+import time
+from typing import List, Optional
 
-load_dotenv()
-openai.api_key = os.getenv('OPENAI_API_KEY')
+load_dotenv()  # OpenAI() reads OPENAI_API_KEY from the environment
+
+def correlation_graph(check, data: List[Article], max_pairs: Optional[int] = None):
+    from openai import OpenAI
 
-def correlation_graph(check, data: List[Article]):
     # Sort articles by timestamp
     data = sorted(data, key=lambda x: x.timestamp)
     
@@ -29,11 +30,12 @@ def correlation_graph(check, data: List[Article]):
         client = OpenAI()
         
         # Extract publisher and analyze severity using OpenAI
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are an expert at analyzing misinformation."},
-                {"role": "user", "content": f"Analyze this text: {data[i].text}"}
+                {"role": "user", "content": f"Analyze this text: {pack_text(data[i].text, 'gpt-4o', site='correlation_graph.analyze')}"}
             ],
             functions=[{
                 "name": "analyze_misinformation", 
@@ -56,6 +58,7 @@ def correlation_graph(check, data: List[Article]):
             }],
             function_call={"name": "analyze_misinformation"}
         )
+        record_call("correlation.analyze", "gpt-4o", time.perf_counter() - started)
         # Parse the function call response
         function_call_response = response.choices[0].message.function_call.arguments
         result_analysis = json.loads(function_call_response)
@@ -69,25 +72,37 @@ def correlation_graph(check, data: List[Article]):
         result["severity"].append(severity)
     
     # Find correlations and build edge relationships
-    for i in range(len(data)):
-        for j in range(i+1, len(data)):
-            # Extract info for items i and j
-            info_i = data[i].text
-            info_j = data[j].text
-            
-            # Calculate correlation using OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a correlation analyzer."},
-                    {"role": "user", "content": f"Is there a correlation between these two articles about {check}? First article: {info_i}, Second article: {info_j}. Respond with only 'yes' or 'no'. Be open minded and appreciative of small links between them."}
-                ]
-            )
-            
-            correlation = response.choices[0].message.content.strip().lower()
-            
-            if correlation == "yes":
-                result["edge"].append([i, j])
+    pairs = [(i, j) for i in range(len(data)) for j in range(i+1, len(data))]
+    if max_pairs is not None:
+        # articles are sorted by timestamp, so check the pairs closest in time first
+        pairs = sorted(pairs, key=lambda p: p[1] - p[0])[:max_pairs]
+
+    # pack each article once, each gets half of the evidence budget in every pair it's part of
+    packed = {
+        k: pack_text(data[k].text, "gpt-4o", site="correlation_graph.correlate", budget=token_budget("gpt-4o") // 2)
+        for k in sorted({k for pair in pairs for k in pair})
+    }
+
+    for i, j in pairs:
+        # Extract info for items i and j
+        info_i = packed[i]
+        info_j = packed[j]
+        
+        # Calculate correlation using OpenAI API
+        started = time.perf_counter()
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a correlation analyzer."},
+                {"role": "user", "content": f"Is there a correlation between these two articles about {check}? First article: {info_i}, Second article: {info_j}. Respond with only 'yes' or 'no'. Be open minded and appreciative of small links between them."}
+            ]
+        )
+        record_call("correlation.pair", "gpt-4o", time.perf_counter() - started)
+        
+        correlation = response.choices[0].message.content.strip().lower()
+        
+        if correlation == "yes":
+            result["edge"].append([i, j])
     # print(json.dumps(result, indent=2))
     return result
 
@@ -0,0 +1,223 @@
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from main import DEDUP_THRESHOLD, DEFAULT_CALL_SECONDS, SEARCH_MAX_AGE_SECONDS, stage_store
+from statement_extractor import TRANSCRIPT_TOKEN_BUDGET, video, video_id_from_url
+from fact_checker import DEFAULT_CASCADE, VerificationCascade
+from evidence_packer import count_tokens, token_budget
+from statement_dedup import group_near_duplicates
+from stage_store import StageStore
+
+"""
+Dry-run cost and latency estimates for analyse_video.
+
+Only the transcript is fetched (and it is stored, so the real run won't fetch it again).
+Every other stage is priced from what would run: roughly 3-4 LLM calls and one search per
+statement group for verification, then one severity call, one call per article and one per
+article pair for each low-truth group. Outputs that are still fresh in the stage store cost
+nothing, and whatever they contain (statement texts, search results) replaces the
+assumptions below. Prompt tokens are counted with tiktoken. Wall time uses the mean
+latency of past calls for the same stage and model, as persisted in the stage store by
+every real run (falling back to the model's mean over all stages, then to
+DEFAULT_CALL_SECONDS / SEARCH_CALL_SECONDS). The verification escalation rate comes
+from the cascade routing counts persisted alongside.
+"""
+
+SEARCH_CALL_SECONDS = 0.5
+SEARCH_REQUESTS_PER_SEARCH = 3 # find_articles(num_results=20) fetches 3 result pages
+PROMPT_OVERHEAD_TOKENS = 150 # instructions and function schema per call
+
+
+@dataclass
+class CostAssumptions:
+    """Rates for stages that haven't run yet; the defaults are rough averages of past runs."""
+    statements_per_video: int = 12 # the extraction prompt asks for the top 10-15
+    tokens_per_statement: int = 40
+    trivial_rate: float = 0.3
+    historical_rate: float = 0.2
+    escalation_rate: float = 0.3
+    low_truth_rate: float = 0.5
+    articles_per_search: int = 20
+    tokens_per_article: int = 60 # search snippets
+    summary_clusters: int = 4
+
+
+@dataclass
+class StageEstimate:
+    llm_calls: float = 0.0
+    search_calls: float = 0.0
+    tokens: float = 0.0
+    seconds: float = 0.0
+    cached: bool = False
+
+    def add(self, other: "StageEstimate"):
+        self.llm_calls += other.llm_calls
+        self.search_calls += other.search_calls
+        self.tokens += other.tokens
+        self.seconds += other.seconds
+        self.cached = self.cached and other.cached
+
+
+@dataclass
+class CostEstimate:
+    url: str
+    statements: int
+    low_truth_statements: float
+    stages: Dict[str, StageEstimate] = field(default_factory=dict)
+
+    @property
+    def total(self) -> StageEstimate:
+        total = StageEstimate(cached=True)
+        for stage in self.stages.values():
+            total.add(stage)
+        return total
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "total": asdict(self.total)}
+
+
+def mean_latency(history: Dict[Tuple[str, str], Tuple[int, float]], stage: str, model: str, default: float) -> float:
+    """Mean seconds per call for (stage, model), else for the model over all stages, else `default`."""
+    calls, seconds = history.get((stage, model), (0, 0.0))
+    if not calls:
+        calls = sum(c for (_, m), (c, _) in history.items() if m == model)
+        seconds = sum(t for (_, m), (_, t) in history.items() if m == model)
+    return seconds / calls if calls else default
+
+
+def observed_escalation_rate(routes: Dict[str, int]) -> Optional[float]:
+    """Share of cascaded claim checks that were escalated to the strong model in past runs."""
+    escalated = routes.get("escalated_band", 0) + routes.get("escalated_vague", 0)
+    cascaded = escalated + routes.get("fast", 0)
+    return escalated / cascaded if cascaded else None
+
+
+def estimate_video(youtube_url: str, store: Optional[StageStore] = None, assumptions: Optional[CostAssumptions] = None,
+                   cascade: VerificationCascade = DEFAULT_CASCADE) -> Optional[CostEstimate]:
+    """Estimates what analyse_video(youtube_url) would cost; None if there is no transcript."""
+    store = stage_store() if store is None else store
+    a = CostAssumptions() if assumptions is None else assumptions
+    video_id = video_id_from_url(youtube_url)
+    history = store.call_latency()
+    escalation_rate = observed_escalation_rate(store.verify_routes())
+    escalation_rate = a.escalation_rate if escalation_rate is None else escalation_rate
+
+    def llm(stage: str, model: str, tokens: float, calls: float = 1.0) -> StageEstimate:
+        seconds = mean_latency(history, stage, model, DEFAULT_CALL_SECONDS)
+        return StageEstimate(llm_calls=calls, tokens=calls * (tokens + PROMPT_OVERHEAD_TOKENS), seconds=calls * seconds)
+
+    def search_cost(searches: float) -> StageEstimate:
+        requests = searches * SEARCH_REQUESTS_PER_SEARCH
+        return StageEstimate(search_calls=requests, seconds=requests * mean_latency(history, "search", "google", SEARCH_CALL_SECONDS))
+
+    def stored(stage: str, key: str, max_age: Optional[float] = None):
+        record = store.get(stage, key)
+        return record if record is not None and store.is_fresh(record, record.inputs_hash, max_age) else None
+
+    transcript = store.cached("transcript", video_id, video_id, lambda: video(video_id))
+    if transcript is None:
+        return None
+    stages = {}
+
+    # statement extraction: one gpt-4o call over the (truncated) transcript
+    record = stored("statements", video_id)
+    if record is not None:
+        texts = [s.text for s in record.value or []]
+        stages["statements"] = StageEstimate(cached=True)
+    else:
+        transcript_tokens = min(count_tokens(" ".join(segment[1] for segment in transcript)), TRANSCRIPT_TOKEN_BUDGET)
+        stages["statements"] = llm("statements", "gpt-4o", transcript_tokens + a.statements_per_video * a.tokens_per_statement * 2)
+        texts = None
+
+    n_statements = len(texts) if texts is not None else min(a.statements_per_video, len(transcript))
+    statement_tokens = [count_tokens(t) for t in texts] if texts is not None else [a.tokens_per_statement] * n_statements
+
+    # embeddings: one batched call; with stored embeddings we also know the near-duplicate groups
+    record = stored("embeddings", video_id)
+    if record is not None and texts is not None:
+        stages["embeddings"] = StageEstimate(cached=True)
+        leaders = group_near_duplicates(record.value, DEDUP_THRESHOLD)
+        groups = sorted(set(leaders))
+    else:
+        seconds = mean_latency(history, "embeddings", "text-embedding-3-small", DEFAULT_CALL_SECONDS)
+        stages["embeddings"] = StageEstimate(llm_calls=1, tokens=sum(statement_tokens), seconds=seconds)
+        groups = list(range(n_statements))
+
+    # verification per group: triviality check, then historical check, Wikipedia or Google evidence and the cascade
+    verification = StageEstimate(cached=True)
+    severity = StageEstimate(cached=True)
+    fast_evidence = token_budget(cascade.fast_model)
+    strong_evidence = token_budget(cascade.strong_model)
+    nontrivial = 1 - a.trivial_rate
+    low_truth = 0.0
+    for g in groups:
+        text = texts[g] if texts is not None else None
+        tokens = statement_tokens[g]
+        verdict = stored("verdict", text) if text is not None else None
+        search = stored("search", text, SEARCH_MAX_AGE_SECONDS) if text is not None else None
+        articles = search.value if search is not None else None
+
+        if verdict is not None:
+            score, evidence = verdict.value
+            articles = evidence if evidence is not None else articles
+            p_low = 1.0 if score is not None and score < 0.4 else 0.0
+        else:
+            cascade_calls = 1 + escalation_rate if cascade.enabled else 1
+            evidence = min(fast_evidence, len(articles) * a.tokens_per_article) if articles is not None else min(fast_evidence, a.articles_per_search * a.tokens_per_article)
+            group = llm("verify.trivial", "gpt-4o", tokens)
+            group.add(llm("verify.historical", "gpt-4", tokens, nontrivial))
+            group.add(llm("verify.wikipedia", "gpt-4o", tokens + token_budget("gpt-4o"), nontrivial * a.historical_rate))
+            google = nontrivial * (1 - a.historical_rate)
+            group.add(llm("verify.claim", cascade.fast_model if cascade.enabled else cascade.strong_model, tokens + evidence, google))
+            if cascade.enabled:
+                group.add(llm("verify.claim", cascade.strong_model, tokens + min(strong_evidence, evidence), google * (cascade_calls - 1)))
+            if search is None:
+                group.add(search_cost(google))
+            verification.add(group)
+            p_low = a.low_truth_rate
+
+        if p_low == 0:
+            continue
+        low_truth += p_low
+
+        # severity: agent call, one call per article and one per article pair (correlation_graph)
+        if text is not None and stored("severity", text) is not None:
+            continue
+        n_articles = len(articles) if articles is not None else a.articles_per_search
+        article_tokens = [min(count_tokens(x.text), token_budget("gpt-4o")) for x in articles] if articles is not None else [a.tokens_per_article] * n_articles
+        mean_article = sum(article_tokens) / n_articles if n_articles else 0
+        pairs = n_articles * (n_articles - 1) / 2
+        group = llm("severity.agent", "gpt-4o", tokens, p_low)
+        group.add(llm("correlation.analyze", "gpt-4o", mean_article, p_low * n_articles))
+        group.add(llm("correlation.pair", "gpt-4o", tokens + 2 * mean_article, p_low * pairs))
+        if articles is None:
+            # verification only searched Google for non-historical, non-trivial claims
+            group.add(search_cost(p_low * (1 - nontrivial * (1 - a.historical_rate))))
+        severity.add(group)
+
+    stages["verification"] = verification
+    stages["severity"] = severity
+
+    # aggregation: local clustering plus one summary call per cluster
+    record = stored("aggregate", video_id)
+    if record is not None:
+        stages["aggregate"] = StageEstimate(cached=True)
+    else:
+        clusters = min(a.summary_clusters, low_truth)
+        stages["aggregate"] = llm("aggregate.summary", "gpt-4o", low_truth * a.tokens_per_statement / max(clusters, 1), clusters)
+
+    return CostEstimate(url=youtube_url, statements=n_statements, low_truth_statements=low_truth, stages=stages)
+
+
+def estimate_batch(youtube_urls: List[str], **kwargs) -> dict:
+    """Per-video estimates plus batch totals; videos without a transcript are listed as skipped."""
+    estimates, skipped = [], []
+    total = StageEstimate(cached=True)
+    for url in youtube_urls:
+        estimate = estimate_video(url, **kwargs)
+        if estimate is None:
+            skipped.append(url)
+            continue
+        estimates.append(estimate.to_dict())
+        total.add(estimate.total)
+    return {"videos": estimates, "skipped": skipped, "total": asdict(total)}
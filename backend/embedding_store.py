@@ -0,0 +1,157 @@
+from typing import List, Optional, Tuple
+import fcntl
+import json
+import os
+import threading
+import numpy as np
+
+"""
+Compact, append-only, memory-mapped embedding storage.
+
+Vectors are L2-normalised and stored as float16 (2 bytes/dim) or row-wise int8 with a
+float32 scale per row (~1 byte/dim), i.e. 3 KB or 1.5 KB per 1536-dim embedding instead
+of 6 KB. Files are opened with np.memmap, so every worker process maps the same page
+cache instead of holding its own copy. Top-k search is a chunked matrix-vector product
+over the quantised rows; optionally the best candidates are re-ranked against the exact
+float32 vectors, of which only the candidate rows are ever paged in. Appends take an
+exclusive flock on the directory's lock file, so concurrent writers in different
+processes get disjoint row ids.
+"""
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+SEARCH_CHUNK_ROWS = 65536
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, dim: int, dtype: str = "int8", keep_exact: bool = False):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {list(DTYPES)}")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != dim or meta["dtype"] != dtype:
+                raise ValueError(f"{directory} holds {meta['dtype']} vectors of dim {meta['dim']}")
+            keep_exact = meta["keep_exact"]
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"dim": dim, "dtype": dtype, "keep_exact": keep_exact}, f)
+
+        self.dim = dim
+        self.dtype = dtype
+        self.keep_exact = keep_exact
+        self._vectors_path = os.path.join(directory, f"vectors.{dtype}")
+        self._scales_path = os.path.join(directory, "scales.float32")
+        self._exact_path = os.path.join(directory, "exact.float32")
+        self._lock_path = os.path.join(directory, "append.lock")
+        self._lock = threading.Lock()
+        self._maps = {}
+        for path in (self._vectors_path, self._scales_path, self._exact_path, self._lock_path):
+            open(path, "ab").close()
+
+    def __len__(self) -> int:
+        # the vectors file is written last on append, so it bounds what is complete
+        row_bytes = self.dim * np.dtype(DTYPES[self.dtype]).itemsize
+        return os.path.getsize(self._vectors_path) // row_bytes
+
+    def _map(self, path: str, dtype, width: int, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.zeros((0, width), dtype=dtype)
+        cached = self._maps.get(path)
+        if cached is None or cached.shape[0] < rows:
+            # remap when other writers (or processes) have appended since we last looked
+            cached = np.memmap(path, dtype=dtype, mode="r", shape=(rows, width))
+            self._maps[path] = cached
+        return cached[:rows]
+
+    def _quantised(self, rows: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        vectors = self._map(self._vectors_path, DTYPES[self.dtype], self.dim, rows)
+        scales = self._map(self._scales_path, np.float32, 1, rows)[:, 0] if self.dtype == "int8" else None
+        return vectors, scales
+
+    def append(self, vectors: np.ndarray) -> List[int]:
+        """Appends vectors and returns their row ids."""
+        unit = _normalise(vectors)
+        if unit.shape[1] != self.dim:
+            raise ValueError(f"expected dim {self.dim}, got {unit.shape[1]}")
+
+        if self.dtype == "int8":
+            scales = np.abs(unit).max(axis=1) / 127
+            scales[scales == 0] = 1
+            quantised = np.round(unit / scales[:, None]).astype(np.int8)
+        else:
+            scales = None
+            quantised = unit.astype(np.float16)
+
+        # threads share one process, other processes are kept out by the flock
+        with self._lock, open(self._lock_path, "rb") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # row ids come from the file sizes once we hold the lock
+                start = len(self)
+                # drop whatever a writer that died mid-append left behind, a stray partial row
+                # would shift every row after it
+                if self.keep_exact:
+                    self._append_rows(self._exact_path, start, 4 * self.dim, unit.tobytes())
+                if scales is not None:
+                    self._append_rows(self._scales_path, start, 4, scales.astype(np.float32).tobytes())
+                self._append_rows(self._vectors_path, start, quantised.itemsize * self.dim, quantised.tobytes())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return list(range(start, start + len(unit)))
+
+    @staticmethod
+    def _append_rows(path: str, start: int, row_bytes: int, data: bytes):
+        with open(path, "r+b") as f:
+            f.truncate(start * row_bytes)
+            f.seek(0, os.SEEK_END)
+            f.write(data)
+
+    def get(self, rows: List[int], exact: bool = False) -> np.ndarray:
+        """Returns float32 vectors for `rows` (dequantised unless exact vectors were kept and requested)."""
+        n = len(self)
+        rows = np.asarray(rows, dtype=np.int64)
+        if exact and self.keep_exact:
+            return np.array(self._map(self._exact_path, np.float32, self.dim, n)[rows])
+        vectors, scales = self._quantised(n)
+        out = np.asarray(vectors[rows], dtype=np.float32)
+        return out * scales[rows][:, None] if scales is not None else out
+
+    def search(self, query: np.ndarray, k: int = 10, rerank: bool = True, oversample: int = 4) -> List[Tuple[int, float]]:
+        """
+        Returns up to k (row, cosine similarity) pairs, best first. With `rerank` and exact
+        vectors available, k * oversample candidates are rescored exactly.
+        """
+        n = len(self)
+        if n == 0 or k <= 0:
+            return []
+        q = _normalise(query)[0]
+        vectors, scales = self._quantised(n)
+
+        candidates = min(n, k * oversample if rerank and self.keep_exact else k)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ q
+        if scales is not None:
+            scores *= scales
+
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if rerank and self.keep_exact:
+            exact = self._map(self._exact_path, np.float32, self.dim, n)
+            scores_top = np.asarray(exact[np.sort(top)]) @ q
+            top = np.sort(top)
+        else:
+            scores_top = scores[top]
+
+        order = np.argsort(-scores_top)[:k]
+        return [(int(top[i]), float(scores_top[i])) for i in order]
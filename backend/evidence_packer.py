@@ -0,0 +1,141 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import re
+
+"""
+Token-budget-aware packing of evidence into verification prompts.
+
+Given a claim and candidate passages (article snippets, Wikipedia paragraphs...), we
+drop duplicates, rank the rest by lexical relevance to the claim and greedily fit them
+into a per-model token budget counted with tiktoken. Prompt size therefore stays
+bounded no matter how much evidence a search returns, and the packed token counts
+are recorded per prompt site so they can be reported.
+"""
+
+# Tokens available for evidence/free text per model, leaving room for instructions and the reply
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4": 5000,
+    "gpt-4o": 12000,
+    "gpt-4o-mini": 12000,
+}
+DEFAULT_TOKEN_BUDGET = 4000
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "was", "were", "be", "that", "this", "it", "with", "as", "by", "at", "from"}
+
+# site -> {"calls", "tokens", "passages", "dropped"}
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "tokens": 0, "passages": 0, "dropped": 0})
+
+
+@dataclass
+class PackedEvidence:
+    text: str
+    tokens: int
+    included: int # passages that made it into the prompt (possibly truncated)
+    dropped: int # duplicates plus passages that did not fit
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def token_budget(model: str) -> int:
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    tokens = _encoding(model).encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return _encoding(model).decode(tokens[:max_tokens])
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def _relevance(claim_terms: set, passage: str) -> float:
+    terms = _terms(passage)
+    if not claim_terms or not terms:
+        return 0.0
+    # share of the claim covered, lightly penalising very long passages
+    return len(claim_terms & terms) / len(claim_terms) - 0.001 * len(terms) ** 0.5
+
+
+def _record(site: str, packed: PackedEvidence):
+    stats = _stats[site]
+    stats["calls"] += 1
+    stats["tokens"] += packed.tokens
+    stats["passages"] += packed.included
+    stats["dropped"] += packed.dropped
+
+
+def pack_evidence(claim: str, passages: List[Tuple[str, str]], model: str, site: str, budget: int = None) -> PackedEvidence:
+    """
+    Packs (title, content) passages into "Title: ...\\nContent: ..." blocks that fit in the
+    token budget for `model`, most relevant to `claim` first.
+    """
+    budget = token_budget(model) if budget is None else budget
+    separator_tokens = count_tokens("\n\n", model)
+
+    #dedupe on normalised content
+    seen = set()
+    unique = []
+    for title, content in passages:
+        key = " ".join(content.lower().split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        unique.append((title, content))
+
+    claim_terms = _terms(claim)
+    ranked = sorted(unique, key=lambda p: _relevance(claim_terms, p[0] + " " + p[1]), reverse=True)
+
+    blocks = []
+    used = 0
+    for title, content in ranked:
+        block = f"Title: {title}\nContent: {content}"
+        cost = count_tokens(block, model) + (separator_tokens if blocks else 0)
+        remaining = budget - used
+        if cost <= remaining:
+            blocks.append(block)
+            used += cost
+            continue
+        # truncate the passage to the space left if a useful amount remains, then stop
+        if remaining > 64:
+            blocks.append(truncate_to_tokens(block, remaining - separator_tokens, model))
+            used = budget
+        break
+
+    text = "\n\n".join(blocks)
+    packed = PackedEvidence(text=text, tokens=count_tokens(text, model), included=len(blocks), dropped=len(passages) - len(blocks))
+    _record(site, packed)
+    print(f"[{site}] packed {packed.included}/{len(passages)} passages into {packed.tokens} tokens (budget {budget})")
+    return packed
+
+
+def pack_text(text: str, model: str, site: str, budget: int = None) -> str:
+    """Fits a single free-text prompt field into the budget for `model`."""
+    budget = token_budget(model) if budget is None else budget
+    tokens = _encoding(model).encode(text, disallowed_special=())
+    if len(tokens) > budget:
+        tokens = tokens[:budget]
+        text = _encoding(model).decode(tokens)
+    _record(site, PackedEvidence(text=text, tokens=len(tokens), included=1, dropped=0))
+    return text
+
+
+def packing_report() -> Dict[str, Dict[str, int]]:
+    """Cumulative packed token counts per prompt site."""
+    return {site: dict(stats) for site, stats in _stats.items()}
@@ -1,9 +1,16 @@
 from statement_extractor import Statement, extract_statements
 from article_finder import find_articles, Article
+from evidence_packer import pack_evidence, packing_report
+from call_stats import record_call, record_route
+from stage_store import StageStore
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import List
-import wikipedia
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 import json
+import os
+import threading
+import time
 
 """
 We take a list of Statements from the YouTube video and compute
@@ -14,13 +21,98 @@ determines that the issue is controversial or confusing we can
 fall back to search results and Google Fact Check API.
 
 Outputs should be normalised floats between 0 and 1.
+
+Evidence checks run through a model cascade: a fast model answers first and the
+claim is escalated to the strong model only if its truthiness lands in the
+uncertainty band around the low-truth cutoff, or if the fast model calls it vague.
 """
-def fact_check(statements: List[Statement]) -> List[float]:
+
+@dataclass
+class VerificationCascade:
+    fast_model: str = os.getenv("FAST_VERIFY_MODEL", "gpt-4o-mini")
+    strong_model: str = os.getenv("STRONG_VERIFY_MODEL", "gpt-4")
+    # escalate when band_low <= truthiness <= band_high (low-truth cutoff is 0.4)
+    band_low: float = float(os.getenv("VERIFY_BAND_LOW", "0.3"))
+    band_high: float = float(os.getenv("VERIFY_BAND_HIGH", "0.5"))
+    enabled: bool = os.getenv("VERIFY_CASCADE", "1") != "0"
+
+
+DEFAULT_CASCADE = VerificationCascade()
+
+# Opt-in: overlap evidence searches with the routing LLM calls. Prefetches wait up to
+# PREFETCH_DELAY_SECONDS for the triviality check, so trivial claims only pay for a search
+# when that check is slower than the delay.
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "0") == "1"
+PREFETCH_DELAY_SECONDS = float(os.getenv("PREFETCH_DELAY_SECONDS", "1.0"))
+PREFETCH_WORKERS = 8
+_prefetch_pool: Optional[ThreadPoolExecutor] = None
+_prefetch_lock = threading.Lock()
+
+# this worker's model -> {"calls", "seconds"} and route -> count, guarded by _stats_lock
+# (every analysis also persists them through call_stats)
+_stats_lock = threading.Lock()
+_tier_stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+_routes = defaultdict(int)
+
+
+def prefetch_pool() -> ThreadPoolExecutor:
+    """The prefetch pool shared by every fact check in this process."""
+    global _prefetch_pool
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _prefetch_pool
+
+
+def _record_tier(model: str, seconds: float):
+    with _stats_lock:
+        _tier_stats[model]["calls"] += 1
+        _tier_stats[model]["seconds"] += seconds
+
+
+def _record_route(route: str):
+    with _stats_lock:
+        _routes[route] += 1
+    record_route(route)
+
+
+def cascade_report(store: Optional[StageStore] = None) -> dict:
+    """
+    Per-tier call counts and mean latency, plus how claims were routed. With `store`, the
+    totals persisted by every worker; otherwise this worker's since it started.
+    """
+    if store is not None:
+        tiers = {model: {"calls": calls, "seconds": seconds} for (stage, model), (calls, seconds) in store.call_latency().items() if stage == "verify.claim"}
+        routes = store.verify_routes()
+    else:
+        with _stats_lock:
+            tiers = {model: dict(stats) for model, stats in _tier_stats.items()}
+            routes = dict(_routes)
+    return {
+        "tiers": {
+            model: {**stats, "mean_seconds": stats["seconds"] / stats["calls"] if stats["calls"] else 0.0}
+            for model, stats in tiers.items()
+        },
+        "routes": routes
+    }
+
+
+def fact_check_with_articles(statements: List[Statement], cascade: VerificationCascade = DEFAULT_CASCADE, speculative: bool = SPECULATIVE_PREFETCH, search: Callable[[str], List[Article]] = find_articles) -> Tuple[List[float], List[Optional[List[Article]]]]:
+    """
+    Returns truth scores and, for each statement, the Google articles fetched while checking it
+    (None if it was never searched). With `speculative`, the Google and Wikipedia searches start
+    once the triviality check has taken PREFETCH_DELAY_SECONDS (or as soon as it says the claim
+    isn't trivial) and overlap the remaining routing calls, so trivial claims only pay for them
+    when their check is slower than the delay.
+    `search` fetches Google articles for a claim (e.g. a cached wrapper around find_articles).
+    """
     from openai import OpenAI
+    import wikipedia
     client = OpenAI()
     
     def check_trivial(statement: str) -> tuple[bool, float]:
         """Returns (is_trivial, truthiness)"""
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4o",
             messages=[
@@ -49,11 +141,13 @@ def fact_check(statements: List[Statement]) -> List[float]:
             }],
             function_call={"name": "analyze_statement"}
         )
+        record_call("verify.trivial", "gpt-4o", time.perf_counter() - started)
         result = json.loads(response.choices[0].message.function_call.arguments)
         return result["is_trivial"] if "is_trivial" in result else False, result["truthiness"] if "truthiness" in result else 0.5
 
     def check_historical(statement: str) -> bool:
         """Returns whether statement is about historical events"""
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4",
             messages=[
@@ -76,179 +170,212 @@ def fact_check(statements: List[Statement]) -> List[float]:
             }],
             function_call={"name": "check_historical"}
         )
+        record_call("verify.historical", "gpt-4", time.perf_counter() - started)
         result = json.loads(response.choices[0].message.function_call.arguments)
         return result["is_historical"]
 
+    def verify_with_model(model: str, statement: str, articles: List[Article]) -> dict:
+        """Returns {"truthiness", "is_vague"} from a single model"""
+        evidence = pack_evidence(statement, [(article.title, article.text) for article in articles], model, site="fact_check.verify_claim")
+        start = time.perf_counter()
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an expert at fact checking claims against source material."},
+                {"role": "user", "content": f"Verify this claim against the following articles. Claim: {statement}\n\nArticles content: {evidence.text}"}
+            ],
+            functions=[{
+                "name": "verify_claim",
+                "description": "Verifies a claim against sources",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "truthiness": {
+                            "type": "number",
+                            "description": "Truth score between 0.1 and 0.9",
+                            "minimum": 0.1,
+                            "maximum": 0.9
+                        },
+                        "is_vague": {
+                            "type": "boolean",
+                            "description": "Whether the claim is too vague or the articles too ambiguous to verify definitively"
+                        }
+                    },
+                    "required": ["truthiness", "is_vague"]
+                }
+            }],
+            function_call={"name": "verify_claim"}
+        )
+        elapsed = time.perf_counter() - start
+        record_call("verify.claim", model, elapsed)
+        _record_tier(model, elapsed)
+        return json.loads(response.choices[0].message.function_call.arguments)
+
+    def verify_claim(statement: str, articles: List[Article]) -> float:
+        """Verifies a claim against search result articles, escalating uncertain answers"""
+        if not cascade.enabled:
+            _record_route("strong_only")
+            return verify_with_model(cascade.strong_model, statement, articles)["truthiness"]
+
+        result = verify_with_model(cascade.fast_model, statement, articles)
+        if result.get("is_vague", False):
+            _record_route("escalated_vague")
+        elif cascade.band_low <= result["truthiness"] <= cascade.band_high:
+            _record_route("escalated_band")
+        else:
+            _record_route("fast")
+            return result["truthiness"]
+
+        print(f"ESCALATE {cascade.fast_model} -> {cascade.strong_model} (truthiness {result['truthiness']})")
+        return verify_with_model(cascade.strong_model, statement, articles)["truthiness"]
+
+    def wikipedia_passages(search_results: List[str]) -> List[tuple]:
+        """Returns (title, paragraph) passages from the first few relevant Wikipedia pages"""
+        passages = []
+        for title in search_results[:3]:
+            try:
+                page = wikipedia.page(title)
+            except wikipedia.exceptions.DisambiguationError as e:
+                # Handle disambiguation by getting first suggested page
+                try:
+                    page = wikipedia.page(e.options[0])
+                except:
+                    continue
+            except:
+                continue
+            passages.extend((page.title, paragraph) for paragraph in page.content.split("\n") if paragraph.strip())
+        return passages
+
+    def verify_historical(statement: str, passages: List[tuple]) -> dict:
+        """Returns {"truthiness", "is_vague"} for a historical claim checked against Wikipedia"""
+        model = "gpt-4o"
+        evidence = pack_evidence(statement, passages, model, site="fact_check.verify_historical")
+        started = time.perf_counter()
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an expert historian tasked with verifying historical claims against Wikipedia sources. If the claim seems vague or cannot be definitively verified with the provided sources, indicate this in your assessment."},
+                {"role": "user", "content": f"Verify this historical claim against the following Wikipedia content. Claim: {statement}\n\nWikipedia content: {evidence.text}"}
+            ],
+            functions=[{
+                "name": "verify_historical_claim",
+                "description": "Verifies a historical claim against Wikipedia sources",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "truthiness": {
+                            "type": "number",
+                            "description": "Truth score between 0.1 and 0.9",
+                            "minimum": 0.1,
+                            "maximum": 0.9
+                        },
+                        "is_vague": {
+                            "type": "boolean",
+                            "description": "Whether the claim is too vague to verify definitively"
+                        }
+                    },
+                    "required": ["truthiness", "is_vague"]
+                }
+            }],
+            function_call={"name": "verify_historical_claim"}
+        )
+        record_call("verify.wikipedia", model, time.perf_counter() - started)
+        return json.loads(response.choices[0].message.function_call.arguments)
+
     truth_scores = []
+    # Google results per statement (None if never searched), reused by the severity stage
+    statement_articles: List[Optional[List[Article]]] = [None] * len(statements)
+    executor = prefetch_pool() if speculative else None
+    unconsumed = {}
+
     id = 0
     for statement in statements:
         print(f"-------TEST {id}-------")
+        index = id
         id += 1
-        is_trivial, trivial_score = check_trivial(statement.text)
+
+        # Speculatively start both searches while the routing calls run, giving the
+        # triviality check a head start so that trivial claims usually skip them
+        decided = threading.Event()
+        trivial = [False]
+
+        def gated(fetch, text=statement.text, decided=decided, trivial=trivial):
+            decided.wait(PREFETCH_DELAY_SECONDS)
+            return None if trivial[0] else fetch(text)
+
+        articles_future = executor.submit(gated, search) if executor else None
+        wiki_future = executor.submit(gated, wikipedia.search) if executor else None
+
+        def articles() -> List[Article]:
+            if statement_articles[index] is None:
+                statement_articles[index] = articles_future.result() if articles_future else search(statement.text)
+            return statement_articles[index]
+
+        is_trivial = True # if the check fails, the prefetches shouldn't run either
+        try:
+            is_trivial, trivial_score = check_trivial(statement.text)
+        finally:
+            trivial[0] = is_trivial
+            decided.set()
         
         if is_trivial:
             print("LLM")
             truth_scores.append(trivial_score)
+            # the claim didn't need evidence, drop whatever hasn't started yet
+            for future in (articles_future, wiki_future):
+                if future:
+                    future.cancel()
             continue
+
+        if articles_future:
+            unconsumed[index] = articles_future
             
         if check_historical(statement.text):
             print("WIKIPEDIA")
             # Try to find relevant Wikipedia articles
             try:
                 # Search Wikipedia for relevant pages
-                search_results = wikipedia.search(statement.text)
+                search_results = wiki_future.result() if wiki_future else wikipedia.search(statement.text)
                 if not search_results:
                     # If no Wikipedia results, treat as non-historical and use regular fact checking
-                    articles = find_articles(statement.text)
-                    articles_content = "\n\n".join([f"Title: {article.title}\nContent: {article.text}" for article in articles])
-                else:
-                    # Get full content of first few relevant Wikipedia pages
-                    wiki_content = []
-                    for title in search_results[:3]:
-                        try:
-                            page = wikipedia.page(title)
-                            wiki_content.append(f"Title: {page.title}\nContent: {page.content}")
-                        except wikipedia.exceptions.DisambiguationError as e:
-                            # Handle disambiguation by getting first suggested page
-                            try:
-                                page = wikipedia.page(e.options[0])
-                                wiki_content.append(f"Title: {page.title}\nContent: {page.content}")
-                            except:
-                                continue
-                        except:
-                            continue
-                    
-                    articles_content = "\n\n".join(wiki_content)
-                
+                    truth_scores.append(verify_claim(statement.text, articles()))
+                    continue
+
                 # Use LLM to verify statement against Wikipedia content
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are an expert historian tasked with verifying historical claims against Wikipedia sources. If the claim seems vague or cannot be definitively verified with the provided sources, indicate this in your assessment."},
-                        {"role": "user", "content": f"Verify this historical claim against the following Wikipedia content. Claim: {statement.text}\n\nWikipedia content: {articles_content}"}
-                    ],
-                    functions=[{
-                        "name": "verify_historical_claim",
-                        "description": "Verifies a historical claim against Wikipedia sources",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "truthiness": {
-                                    "type": "number",
-                                    "description": "Truth score between 0.1 and 0.9",
-                                    "minimum": 0.1,
-                                    "maximum": 0.9
-                                },
-                                "is_vague": {
-                                    "type": "boolean",
-                                    "description": "Whether the claim is too vague to verify definitively"
-                                }
-                            },
-                            "required": ["truthiness", "is_vague"]
-                        }
-                    }],
-                    function_call={"name": "verify_historical_claim"}
-                )
-                result = json.loads(response.choices[0].message.function_call.arguments)
+                result = verify_historical(statement.text, wikipedia_passages(search_results))
                 
                 if result["is_vague"]:
                     # For vague claims, fall back to Google fact check
-                    articles = find_articles(statement.text)
-                    articles_content = "\n\n".join([f"Title: {article.title}\nContent: {article.text}" for article in articles])
-                    
-                    response = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are an expert at fact checking claims against source material."},
-                            {"role": "user", "content": f"Verify this claim against the following articles. Claim: {statement.text}\n\nArticles content: {articles_content}"}
-                        ],
-                        functions=[{
-                            "name": "verify_claim",
-                            "description": "Verifies a claim against sources",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "truthiness": {
-                                        "type": "number",
-                                        "description": "Truth score between 0.1 and 0.9",
-                                        "minimum": 0.1,
-                                        "maximum": 0.9
-                                    }
-                                },
-                                "required": ["truthiness"]
-                            }
-                        }],
-                        function_call={"name": "verify_claim"}
-                    )
-                    result = json.loads(response.choices[0].message.function_call.arguments)
-                
-                truth_scores.append(result["truthiness"])
+                    truth_scores.append(verify_claim(statement.text, articles()))
+                else:
+                    truth_scores.append(result["truthiness"])
                 
             except Exception as e:
                 # On any error, fall back to regular fact checking
-                articles = find_articles(statement.text)
-                articles_content = "\n\n".join([f"Title: {article.title}\nContent: {article.text}" for article in articles])
-                
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are an expert at fact checking claims against source material."},
-                        {"role": "user", "content": f"Verify this claim against the following articles. Claim: {statement.text}\n\nArticles content: {articles_content}"}
-                    ],
-                    functions=[{
-                        "name": "verify_claim",
-                        "description": "Verifies a claim against sources",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "truthiness": {
-                                    "type": "number",
-                                    "description": "Truth score between 0.1 and 0.9",
-                                    "minimum": 0.1,
-                                    "maximum": 0.9
-                                }
-                            },
-                            "required": ["truthiness"]
-                        }
-                    }],
-                    function_call={"name": "verify_claim"}
-                )
-                result = json.loads(response.choices[0].message.function_call.arguments)
-                truth_scores.append(result["truthiness"])
+                truth_scores.append(verify_claim(statement.text, articles()))
         else:
             print("GOOGLE")
-            articles = find_articles(statement.text)
-            articles_content = "\n\n".join([f"Title: {article.title}\nContent: {article.text}" for article in articles])
-            
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert at fact checking claims against source material."},
-                    {"role": "user", "content": f"Verify this claim against the following articles. Claim: {statement.text}\n\nArticles content: {articles_content}"}
-                ],
-                functions=[{
-                    "name": "verify_claim",
-                    "description": "Verifies a claim against sources",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "truthiness": {
-                                "type": "number",
-                                "description": "Truth score between 0.1 and 0.9",
-                                "minimum": 0.1,
-                                "maximum": 0.9
-                            }
-                        },
-                        "required": ["truthiness"]
-                    }
-                }],
-                function_call={"name": "verify_claim"}
-            )
-            result = json.loads(response.choices[0].message.function_call.arguments)
-            truth_scores.append(result["truthiness"])
-            
+            if wiki_future:
+                wiki_future.cancel()
+            truth_scores.append(verify_claim(statement.text, articles()))
+
+    # hand over Google results that were prefetched for non-trivial claims but never consumed
+    for index, future in unconsumed.items():
+        if statement_articles[index] is None and not future.cancelled():
+            try:
+                statement_articles[index] = future.result()
+            except Exception:
+                pass
+
+    return truth_scores, statement_articles
+
+
+def fact_check(statements: List[Statement], cascade: VerificationCascade = DEFAULT_CASCADE) -> List[float]:
+    truth_scores, _ = fact_check_with_articles(statements, cascade)
     return truth_scores
 
 if __name__ == "__main__":
     statements = extract_statements("https://www.youtube.com/watch?v=ShRYdYTtIx8")
-    print(fact_check(statements))
\ No newline at end of file
+    print(fact_check(statements))
+    print(packing_report())
+    print(cascade_report())
\ No newline at end of file
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from flask import Response, request
+import gzip
+import hashlib
+import orjson
+
+"""
+Serialize finished results once and serve the stored bytes on every hit.
+
+Each payload is encoded with orjson, gzipped up front and tagged with a strong
+ETag derived from the body, so repeated polls either get a 304 or the
+pre-compressed bytes without touching the encoder again. The gzip and identity
+encodings are different representations, so each gets its own strong ETag.
+"""
+
+@dataclass(frozen=True)
+class PreparedJSON:
+    body: bytes
+    gzipped: bytes
+    etag: str # quoted strong validator, e.g. "\"3f2a...\""
+    gzip_etag: str # validator of the gzipped representation, e.g. "\"3f2a...-gz\""
+
+
+def prepare_json(obj) -> PreparedJSON:
+    body = orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    # mtime=0 keeps the gzip bytes deterministic for identical bodies
+    gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return PreparedJSON(body=body, gzipped=gzipped, etag=f'"{digest}"', gzip_etag=f'"{digest}-gz"')
+
+
+def _matches(etag: str, if_none_match: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def send_prepared(prepared: PreparedJSON) -> Response:
+    """Builds the response for the current request, honouring If-None-Match and Accept-Encoding."""
+    gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+    headers = {
+        "ETag": prepared.gzip_etag if gzipped else prepared.etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache", # clients may store it but must revalidate
+    }
+
+    if _matches(headers["ETag"], request.headers.get("If-None-Match", "")):
+        return Response(status=304, headers=headers)
+
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(prepared.gzipped, mimetype="application/json", headers=headers)
+
+    return Response(prepared.body, mimetype="application/json", headers=headers)
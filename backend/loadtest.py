@@ -0,0 +1,218 @@
+import argparse
+import logging
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+"""
+Concurrent load test for the Flask API.
+
+By default the app is served in-process with `get_app_data` swapped for a stand-in that
+sleeps for a configurable pipeline latency and returns a synthetic analysis, and with the
+result cache and lease database in a temporary directory. Workers then hammer the
+endpoints with a weighted request mix over a pool of videos with skewed popularity, and
+we report p50/p95/p99 latency, throughput and error rate per endpoint, the cache hit
+ratios from /cache/stats, and how many pipeline runs the stand-in actually performed.
+Pass --url to point the same workload at an already running server instead.
+"""
+
+DEFAULT_MIX = "misinformation=1,statement=4,provenance=4,video_url=1,lvl_2_title=1"
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def fake_app_data(clusters: int, statements: int, articles: int, pipeline_latency: float, runs: list):
+    """Returns a latency-injecting stand-in for main.get_app_data."""
+    from main import AppData
+
+    lock = threading.Lock()
+
+    def get_app_data(youtube_url: str, deadline=None) -> AppData:
+        with lock:
+            runs.append(youtube_url)
+        time.sleep(pipeline_latency if deadline is None else min(deadline, pipeline_latency))
+        return AppData(
+            url=youtube_url,
+            misinformation_graph={
+                "nodes": list(range(clusters)),
+                "names": [f"Narrative {i}" for i in range(clusters)],
+                "severities": [0.5] * clusters,
+                "truthiness": [0.2] * clusters,
+                "edges": [[i, i + 1] for i in range(clusters - 1)],
+                "partial": False
+            },
+            statement_graphs=[{
+                "nodes": list(range(statements)),
+                "text": [f"Statement {j} of cluster {i}" for j in range(statements)],
+                "dates": [f"{j}:00" for j in range(statements)],
+                "edges": [[j, j + 1] for j in range(statements - 1)]
+            } for i in range(clusters)],
+            article_dagraph=[{
+                "nodes": list(range(articles)),
+                "nodename": [f"Article {a}" for a in range(articles)],
+                "severity": [3] * articles,
+                "urls": [f"https://example.com/{a}" for a in range(articles)],
+                "edge": [[a, a + 1] for a in range(articles - 1)]
+            } for _ in range(clusters * statements)]
+        )
+
+    return get_app_data
+
+
+def start_stub_server(args, runs: list, workdir: str) -> str:
+    from werkzeug.serving import make_server
+    import app as backend
+    from result_cache import ResultCache
+    from single_flight import SingleFlight
+
+    backend.get_app_data = fake_app_data(args.clusters, args.statements, args.articles, args.pipeline_latency, runs)
+    backend.result_cache = ResultCache(workdir, max_memory_items=args.memory_items)
+    backend.single_flight = SingleFlight(f"{workdir}/leases.sqlite3", poll_interval=0.05)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR) # per-request access logs drown the report
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run_load(base_url: str, args) -> dict:
+    import requests
+
+    mix = parse_mix(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    videos = [f"vid{i:05d}" for i in range(args.videos)]
+    popularity = [1 / (rank + 1) for rank in range(args.videos)] # Zipf-like, a few hot videos
+    seen_videos = []
+    seen_lock = threading.Lock()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    results_lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    local = threading.local()
+
+    def request_once():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+
+        endpoint = random.choices(endpoints, weights)[0]
+        with seen_lock:
+            known = list(seen_videos)
+        if endpoint != "misinformation" and not known:
+            endpoint = "misinformation"
+
+        if endpoint == "misinformation":
+            video = random.choices(videos, popularity)[0]
+            url = f"{base_url}/misinformation/{quote('https://www.youtube.com/watch?v=' + video, safe='')}"
+        else:
+            video = random.choice(known)
+            index = random.randrange(args.clusters if endpoint == "statement" else args.clusters * args.statements)
+            path = {"statement": f"/statement/{index}", "provenance": f"/provenance/{index}"}.get(endpoint, f"/{endpoint}")
+            url = f"{base_url}{path}?video={video}"
+
+        started = time.perf_counter()
+        try:
+            response = session.get(url, headers={"Accept-Encoding": "gzip"}, timeout=args.timeout)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+
+        with results_lock:
+            latencies[endpoint].append(elapsed)
+            if not ok:
+                errors[endpoint] += 1
+        if ok and endpoint == "misinformation":
+            with seen_lock:
+                if video not in seen_videos:
+                    seen_videos.append(video)
+
+    def worker():
+        while time.monotonic() < deadline:
+            request_once()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker)
+    wall = time.monotonic() - started
+
+    try:
+        cache_stats = requests.get(f"{base_url}/cache/stats", timeout=args.timeout).json()
+    except (requests.RequestException, ValueError):
+        cache_stats = {}
+    return {"latencies": latencies, "errors": errors, "wall": wall, "cache": cache_stats}
+
+
+def report(result: dict, runs: list):
+    latencies, errors, wall = result["latencies"], result["errors"], result["wall"]
+    total = sum(len(v) for v in latencies.values())
+    failed = sum(errors.values())
+
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, values in sorted(latencies.items()):
+        print(f"{endpoint:<16}{len(values):>10}{errors[endpoint]:>8}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}{percentile(values, 99) * 1000:>10.1f}")
+    everything = [v for values in latencies.values() for v in values]
+    print(f"{'all':<16}{total:>10}{failed:>8}"
+          f"{percentile(everything, 50) * 1000:>10.1f}{percentile(everything, 95) * 1000:>10.1f}{percentile(everything, 99) * 1000:>10.1f}")
+    print(f"\nthroughput: {total / wall:.1f} req/s over {wall:.1f}s, error rate: {failed / total if total else 0:.2%}")
+
+    for endpoint, stats in sorted(result["cache"].get("endpoints", {}).items()):
+        print(f"cache {endpoint:<16} hit ratio {stats['hit_rate']:.2%} ({stats['hits']} hits, {stats['misses']} misses)")
+    if runs is not None:
+        print(f"pipeline runs: {len(runs)} for {len(set(runs))} distinct videos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Flask API')
+    parser.add_argument('--url', help='Target a running server instead of the in-process stub backend')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted endpoint mix, e.g. "misinformation=1,statement=4"')
+    parser.add_argument('--videos', type=int, default=50, help='Number of distinct videos requested')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--pipeline-latency', type=float, default=2.0, help='Seconds the stub pipeline takes per video')
+    parser.add_argument('--clusters', type=int, default=5, help='Misinformation clusters per stub analysis')
+    parser.add_argument('--statements', type=int, default=4, help='Statements per cluster in the stub analysis')
+    parser.add_argument('--articles', type=int, default=10, help='Articles per statement in the stub analysis')
+    parser.add_argument('--memory-items', type=int, default=16, help='In-memory cache tier size for the stub server')
+    args = parser.parse_args()
+
+    runs = None
+    workdir = None
+    base_url = args.url
+    if base_url is None:
+        runs = []
+        workdir = tempfile.mkdtemp(prefix="loadtest-cache-")
+        base_url = start_stub_server(args, runs, workdir)
+
+    try:
+        report(run_load(base_url.rstrip("/"), args), runs)
+    finally:
+        if workdir:
+            import app as backend
+            backend.result_cache.flush_popularity() # before its directory goes away
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
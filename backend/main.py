@@ -2,14 +2,81 @@ import os
 # Fix OpenMP library conflict warning on macOS
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
-from statement_extractor import extract_statements, Statement
-from fact_checker import fact_check
+from statement_extractor import extract_statements, video, video_id_from_url, Statement
+from fact_checker import fact_check_with_articles
 from severity_checker import check_severity
 from article_finder import find_articles, Article
-from statement_aggregator import aggregate_statements, Misinformation
+from statement_aggregator import aggregate_statements, embed_texts, similarity_edges, Misinformation
+from statement_dedup import collapse_near_duplicates
+from stage_store import StageStore, inputs_hash
+from narrative_index import NarrativeIndex
+from embedding_store import EmbeddingStore
+import call_stats
 
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 from dataclasses import dataclass
+import numpy as np
+import time
+
+# Sparse similarity edges: neighbours kept per node and minimum cosine similarity
+EDGE_TOP_K = 2
+EDGE_THRESHOLD = 0.5
+
+# Statements at least this cosine-similar are verified once as a group
+DEDUP_THRESHOLD = 0.92
+
+# Anytime mode: time kept back for clustering/summaries, and the initial per-LLM-call latency guess
+AGGREGATION_RESERVE_SECONDS = 10.0
+DEFAULT_CALL_SECONDS = 2.0
+
+# Per-stage outputs for incremental re-analysis. Transcripts, statements and embeddings never
+# go stale, search results expire after a day, verdicts and severities last until their evidence changes.
+STAGE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "stages.sqlite3")
+SEARCH_MAX_AGE_SECONDS = 24 * 60 * 60
+# Expired outputs are deleted at most this often, so the database doesn't grow without bound
+STAGE_MAX_AGES = {"search": SEARCH_MAX_AGE_SECONDS}
+PRUNE_INTERVAL_SECONDS = 60 * 60
+_stage_store: Optional[StageStore] = None
+_last_prune = 0.0
+
+# Corpus-wide narratives that low-truth statements from every video are assigned to
+NARRATIVE_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "narratives.sqlite3")
+NARRATIVE_EMBEDDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "narrative_embeddings")
+EMBEDDING_DIM = 1536 # text-embedding-3-small
+_narrative_index: Optional[NarrativeIndex] = None
+
+
+def stage_store() -> StageStore:
+    global _stage_store
+    if _stage_store is None:
+        _stage_store = StageStore(STAGE_STORE_PATH)
+    return _stage_store
+
+
+def prune_stages(force: bool = False) -> int:
+    """Deletes expired stage outputs (at most once per PRUNE_INTERVAL_SECONDS unless forced)."""
+    global _last_prune
+    if not force and time.time() - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_prune = time.time()
+    return stage_store().prune(STAGE_MAX_AGES)
+
+
+def expire_searches(video_id: str):
+    """Drops the stored search results for a video's statements, so the next analysis searches again."""
+    store = stage_store()
+    record = store.get("statements", video_id)
+    for statement in (record.value or []) if record is not None else []:
+        store.invalidate("search", statement.text)
+
+
+def narrative_index() -> NarrativeIndex:
+    global _narrative_index
+    if _narrative_index is None:
+        os.makedirs(os.path.dirname(NARRATIVE_INDEX_PATH), exist_ok=True)
+        embeddings = EmbeddingStore(NARRATIVE_EMBEDDINGS_DIR, EMBEDDING_DIM, dtype="int8")
+        _narrative_index = NarrativeIndex(NARRATIVE_INDEX_PATH, embeddings)
+    return _narrative_index
 
 @dataclass
 class AppData:
@@ -18,76 +85,206 @@ class AppData:
     article_dagraph: List[dict] # List of Article DAGs
     statement_graphs: List[dict] # List of Graph of Statements
     misinformation_graph: dict # List of Misinformation as JSON
+    partial: bool = False # True if a deadline cut the analysis short
+
+
+class Deadline:
+    """Wall-clock budget for an analysis; unbounded when seconds is None."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.unbounded = seconds is None
+        self.end = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return float("inf") if self.unbounded else self.end - time.monotonic()
 
 
 # "https://www.youtube.com/watch?v=ShRYdYTtIx8"
 
-def get_app_data(youtube_url: str) -> AppData:
-    mg, sgs, adgs = analyse_video(youtube_url)
+def get_app_data(youtube_url: str, deadline: Optional[float] = None) -> AppData:
+    try:
+        mg, sgs, adgs = analyse_video(youtube_url, deadline)
+    finally:
+        # persist the call latencies and cascade routes of this run for the cost estimator and /cascade/stats
+        stage_store().record_calls(call_stats.drain())
+        stage_store().record_routes(call_stats.drain_routes())
+        prune_stages()
 
     return AppData(
         url=youtube_url,
         misinformation_graph=mg,
         statement_graphs=sgs,
-        article_dagraph=adgs
+        article_dagraph=adgs,
+        partial=mg.get("partial", False)
     )
 
 
-def analyse_video(youtube_url: str):
-    statements = extract_statements(youtube_url)
+def empty_graph(partial: bool = False) -> dict:
+    return {
+        "nodes": [],
+        "names": [],
+        "severities": [],
+        "truthiness": [],
+        "edges": [],
+        "partial": partial
+    }
+
+
+def affordable_checks(seconds: float, call_seconds: float, n_articles: int) -> Tuple[int, int]:
+    """
+    Splits the LLM calls that fit in `seconds` for one statement into (articles, pairwise checks).
+    One call goes to the severity agent, up to half of the rest to article nodes, the remainder
+    to correlation pairs.
+    """
+    calls = int(seconds / call_seconds) - 1
+    if calls <= 0:
+        return 0, 0
+    max_articles = min(n_articles, max(1, calls // 2))
+    return max_articles, calls - max_articles
+
+
+def analyse_video(youtube_url: str, deadline: Optional[float] = None, store: Optional[StageStore] = None):
+    """
+    Runs the full pipeline, reusing every stage output in `store` that is still fresh, so a
+    re-analysis only recomputes stale stages and whatever depends on them. With a `deadline` in seconds it runs in "anytime" mode: statement
+    groups are processed most controversial first, articles and pairwise checks per statement
+    are capped to fit the time left, and once time runs out only the fully processed statements
+    make it into the graph, which is then flagged "partial".
+    """
+    clock = Deadline(deadline)
+    partial = False
+    store = stage_store() if store is None else store
+    video_id = video_id_from_url(youtube_url)
+
+    transcript = store.cached("transcript", video_id, video_id, lambda: video(video_id))
+    if transcript is None:
+        return empty_graph(), [], []
+    statements = store.cached("statements", video_id, transcript, lambda: extract_statements(youtube_url, transcript))
     
     # Handle case where no statements were extracted
     if not statements:
-        return {
-            "nodes": [],
-            "names": [],
-            "severities": [],
-            "truthiness": [],
-            "edges": []
-        }, [], []
+        return empty_graph(), [], []
     
-    truth_scores = fact_check(statements)
+    # Verify each group of near-duplicate statements once and fan the verdict out to its members
+    texts = [s.text for s in statements]
+    embeddings = store.cached("embeddings", video_id, texts, lambda: embed_texts(texts))
+    representatives, membership, embeddings = collapse_near_duplicates(statements, DEDUP_THRESHOLD, embeddings)
+
+    def search(text: str) -> List[Article]:
+        # failed and empty searches aren't stored, so an outage isn't served back for a day
+        try:
+            return store.cached("search", text, text, lambda: find_articles(text, raise_errors=True) or None, max_age=SEARCH_MAX_AGE_SECONDS) or []
+        except Exception as e:
+            print(f"Search failed for {text[:60]}: {e}")
+            return []
+
+    def verify(statement: Statement) -> Tuple[float, Optional[List[Article]]]:
+        # a verdict stays valid until the search results it was checked against change
+        # (no results, e.g. during an outage, don't count as a change)
+        record = store.get("verdict", statement.text)
+        if record is not None:
+            score, evidence = record.value
+            if evidence is None:
+                return score, evidence
+            articles = search(statement.text)
+            if not articles or record.inputs_hash == inputs_hash(articles):
+                return score, evidence
+        scores, articles = fact_check_with_articles([statement], search=search)
+        if articles[0] != []:
+            store.put("verdict", statement.text, inputs_hash(articles[0]), (scores[0], articles[0]))
+        return scores[0], articles[0]
+
+    # a group is as controversial as its most controversial member
+    group_priority = [len(statements)] * len(representatives)
+    for i, g in enumerate(membership):
+        group_priority[g] = min(group_priority[g], statements[i].priority)
+    priority_order = sorted(range(len(representatives)), key=lambda g: group_priority[g])
+
+    representative_scores = [None] * len(representatives)
+    representative_articles = [None] * len(representatives)
+    for g in priority_order:
+        if clock.remaining() < AGGREGATION_RESERVE_SECONDS:
+            partial = True
+            break
+        representative_scores[g], representative_articles[g] = verify(representatives[g])
+
+    truth_scores = [representative_scores[g] for g in membership]
 
     #filter for low-truth statements (fixing the iteration over indices)
-    low_truth = [statements[i] for i in range(len(truth_scores)) if truth_scores[i] < 0.4]
-    low_truth_truth_scores = [score for score in truth_scores if score < 0.4]
+    low_truth_ids = [i for i in range(len(truth_scores)) if truth_scores[i] is not None and truth_scores[i] < 0.4]
     
     #handle case where all statements are true (no misinformation found)
-    if not low_truth:
-        return {
-            "nodes": [],
-            "names": [],
-            "severities": [],
-            "truthiness": [],
-            "edges": []
-        }, [], []
-
-    #retrieve articles for each low-truth statement
-    articles = [find_articles(statement) for statement in low_truth] # 1:1 with statement
-
-    #use articles to assess severity of low-truth statements
-    severity = check_severity(low_truth, articles)
-    
-    # Handle empty severity results
-    if not severity:
-        severity_scores = [1] * len(low_truth)  # Default severity
-        article_dags = [{"nodes": [], "nodename": [], "severity": [], "urls": [], "edge": []} for _ in low_truth]
-    else:
-        severity_scores, article_dags = zip(*severity) # 1:1 with statements
-        severity_scores = list(severity_scores)  # Convert tuple to list
-        article_dags = list(article_dags)  # Convert tuple to list
+    if not low_truth_ids:
+        return empty_graph(partial), [], []
+
+    #only one member of each near-duplicate group needs articles and a severity check
+    low_truth_groups = sorted({membership[i] for i in low_truth_ids}, key=lambda g: group_priority[g])
+
+    #assess severity of low-truth representatives, reusing any articles fetched during fact checking
+    severity_by_group = {}
+    call_seconds = DEFAULT_CALL_SECONDS
+    for k, g in enumerate(low_truth_groups):
+        articles = representative_articles[g] if representative_articles[g] is not None else search(representatives[g].text)
+        max_pairs = None
+
+        if not clock.unbounded:
+            # share the time left (minus aggregation) evenly over the groups still to do
+            share = (clock.remaining() - AGGREGATION_RESERVE_SECONDS) / (len(low_truth_groups) - k)
+            if share < call_seconds:
+                partial = True
+                break
+            max_articles, max_pairs = affordable_checks(share, call_seconds, len(articles))
+            articles = articles[:max_articles]
+
+        statement = representatives[g]
+        hashed = inputs_hash((articles, max_pairs))
+        record = store.get("severity", statement.text)
+        if store.is_fresh(record, hashed):
+            severity_by_group[g] = record.value
+            continue
+
+        started = time.monotonic()
+        severity_by_group[g] = check_severity([statement], [articles], max_pairs)[0]
+        store.put("severity", statement.text, hashed, severity_by_group[g])
+
+        #refine the per-call latency estimate from what this statement actually cost
+        pairs = len(articles) * (len(articles) - 1) // 2
+        calls = 1 + len(articles) + (pairs if max_pairs is None else min(pairs, max_pairs))
+        call_seconds = 0.5 * call_seconds + 0.5 * (time.monotonic() - started) / calls
+
+    #only statements whose group was fully processed make it into the graph
+    low_truth_ids = [i for i in low_truth_ids if membership[i] in severity_by_group]
+    if not low_truth_ids:
+        return empty_graph(partial), [], []
+
+    low_truth = [statements[i] for i in low_truth_ids]
+    low_truth_truth_scores = [truth_scores[i] for i in low_truth_ids]
+
+    # fan the group results back out, 1:1 with low_truth statements
+    severity_scores = [severity_by_group[membership[i]][0] for i in low_truth_ids]
+    article_dags = [severity_by_group[membership[i]][1] for i in low_truth_ids]
 
     for i, low_truth_s in enumerate(low_truth):
         low_truth_s.severity = severity_scores[i]
         low_truth_s.truthiness = low_truth_truth_scores[i]
 
     # Aggregate misinformation into large categories
-    misinformation = aggregate_statements(low_truth, low_truth_truth_scores, severity_scores)
+    misinformation = store.cached(
+        "aggregate", video_id, (low_truth, low_truth_truth_scores, severity_scores),
+        lambda: aggregate_statements(low_truth, low_truth_truth_scores, severity_scores, embeddings[low_truth_ids])
+    )
+
+    # Link this video's misinformation into the narratives recurring across videos
+    try:
+        narrative_index().add_video(video_id, low_truth, embeddings[low_truth_ids])
+    except Exception as e:
+        print(f"Error updating narrative index: {e}")
 
     misinformation_graph = misinformation_to_graph(misinformation)
+    misinformation_graph["partial"] = partial
     statement_graphs = []
     for m in misinformation:
-        statement_graphs.append(statement_to_graph(m.statements, ))
+        statement_graphs.append(statement_to_graph(m.statements, m.embeddings))
 
     return misinformation_graph, statement_graphs, article_dags
 
@@ -98,7 +295,9 @@ def misinformation_to_graph(misinformation: List[Misinformation]) -> dict:
     names = list(map(lambda x: x.summary, misinformation))
     severities = list(map(lambda x: x.severity, misinformation))
     truthiness = list(map(lambda x: x.truthiness, misinformation))
-    edges = []
+    # Link clusters whose centroids are close in embedding space
+    centroids = [m.centroid for m in misinformation]
+    edges = similarity_edges(np.array(centroids), EDGE_TOP_K, EDGE_THRESHOLD) if n > 1 and all(c is not None for c in centroids) else []
 
     return {
         "nodes": nodes,
@@ -109,14 +308,15 @@ def misinformation_to_graph(misinformation: List[Misinformation]) -> dict:
     }
 
 
-def statement_to_graph(statements: List[Statement]) -> dict:
+def statement_to_graph(statements: List[Statement], embeddings: Optional[np.ndarray] = None) -> dict:
     n = len(statements)
     nodes = list(range(n))
     text = list(map(lambda x: x.text, statements))
     dates = list(map(lambda x: x.timestamp, statements))
     truthiness = list(map(lambda x: x.truthiness, statements))
     severity = list(map(lambda x: x.severity, statements))
-    edges = []
+    # Link statements within the cluster using the embeddings the aggregator already computed
+    edges = similarity_edges(embeddings, EDGE_TOP_K, EDGE_THRESHOLD) if embeddings is not None else []
 
     return {
         "nodes": nodes,
@@ -0,0 +1,339 @@
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import sqlite3
+import threading
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+"""
+Corpus-wide narrative clusters, updated online.
+
+Low-truth statements from every analysed video are assigned to the nearest existing
+narrative (cosine similarity against the narrative centroids) or spawn a new one when
+nothing is close enough. Each narrative keeps the running sum of its members' unit
+embeddings, so assignment, removal and merging are O(1) centroid updates rather than
+re-clustering the corpus. Every writing transaction bumps a version stamped on the rows
+it touches, so each process keeps the centroid sums in memory and only re-reads what
+changed since. A compaction merges narratives whose centroids have drifted together; it
+runs in a background thread every compact_every assignments (or from the CLI), finds
+close pairs blockwise against a snapshot and only takes the write lock to apply them.
+Members are indexed by narrative and by video in SQLite, so reading a
+narrative's statements across videos doesn't scan the corpus. Member embeddings live in
+a quantised, memory-mapped EmbeddingStore shared by all workers.
+"""
+
+@dataclass
+class NarrativeMember:
+    narrative_id: int
+    video_id: str
+    text: str
+    timestamp: str
+    truthiness: float
+    severity: float
+    member_id: int # pass as after_id to fetch the next page
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+# Rows of the centroid similarity matrix computed at once during compaction
+COMPACT_BLOCK_ROWS = 1024
+
+
+class NarrativeIndex:
+    def __init__(self, path: str, embeddings: EmbeddingStore, spawn_threshold: float = 0.75, merge_threshold: float = 0.9, compact_every: int = 500):
+        self.path = path
+        self.embeddings = embeddings
+        self.spawn_threshold = spawn_threshold
+        self.merge_threshold = merge_threshold
+        self.compact_every = compact_every
+        # centroid sums cached across calls, as of meta 'version'; guarded by _lock
+        self._lock = threading.Lock()
+        self._ids: List[int] = []
+        self._counts: Dict[int, int] = {}
+        self._sums: Optional[Dict[int, np.ndarray]] = None
+        self._version = 0
+        self._compacting = False
+        with closing(self._connect()) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS narratives (id INTEGER PRIMARY KEY, count INTEGER NOT NULL, sum BLOB NOT NULL, version INTEGER NOT NULL DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS members (
+                    id INTEGER PRIMARY KEY, narrative_id INTEGER NOT NULL, video_id TEXT NOT NULL, text TEXT NOT NULL,
+                    timestamp TEXT, truthiness REAL, severity REAL, embedding_row INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS members_by_narrative ON members (narrative_id, id);
+                CREATE INDEX IF NOT EXISTS members_by_video ON members (video_id);
+                CREATE INDEX IF NOT EXISTS members_by_embedding ON members (embedding_row);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+            """)
+            if "version" not in [r[1] for r in conn.execute("PRAGMA table_info(narratives)")]:
+                conn.execute("ALTER TABLE narratives ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _load_centroids(self, conn: sqlite3.Connection):
+        """
+        Brings the cached centroid sums up to date, reading only narratives written since
+        the cached version. Call with _lock held, inside a transaction.
+        """
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        if self._sums is None or version < self._version:
+            rows = conn.execute("SELECT id, count, sum FROM narratives ORDER BY id").fetchall()
+            self._sums = {}
+            self._counts = {}
+        elif version > self._version:
+            rows = conn.execute("SELECT id, count, sum FROM narratives WHERE version > ?", (self._version,)).fetchall()
+        else:
+            rows = None
+        if rows is not None:
+            for narrative_id, count, total in rows:
+                self._counts[narrative_id] = count
+                self._sums[narrative_id] = np.frombuffer(total, dtype=np.float32).copy()
+            # deletions (removed videos, merges) only show up as missing ids
+            self._ids = [r[0] for r in conn.execute("SELECT id FROM narratives ORDER BY id")]
+            alive = set(self._ids)
+            for narrative_id in [i for i in self._sums if i not in alive]:
+                del self._sums[narrative_id], self._counts[narrative_id]
+        self._version = version
+        return self._ids, self._counts, self._sums
+
+    def _begin_write(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        self._load_centroids(conn)
+        # rows written in this transaction carry the new version
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        self._version += 1
+
+    def _rollback(self, conn: sqlite3.Connection):
+        conn.execute("ROLLBACK")
+        # the cached sums may hold this transaction's updates
+        self._sums = None
+
+    @staticmethod
+    def _save_centroid(conn: sqlite3.Connection, narrative_id: int, count: int, total: np.ndarray):
+        if count <= 0:
+            conn.execute("DELETE FROM narratives WHERE id = ?", (narrative_id,))
+        else:
+            conn.execute("UPDATE narratives SET count = ?, sum = ?, version = (SELECT value FROM meta WHERE key = 'version') WHERE id = ?",
+                         (count, total.astype(np.float32).tobytes(), narrative_id))
+
+    def _remove_video(self, conn: sqlite3.Connection, video_id: str):
+        rows = conn.execute("SELECT narrative_id, embedding_row FROM members WHERE video_id = ?", (video_id,)).fetchall()
+        if not rows:
+            return
+        ids, counts, sums = self._load_centroids(conn)
+        # the embedding rows stay in the append-only store but are no longer referenced
+        vectors = self.embeddings.get([r[1] for r in rows], exact=True)
+        for (narrative_id, _), vector in zip(rows, vectors):
+            if narrative_id in sums:
+                sums[narrative_id] -= vector
+                counts[narrative_id] -= 1
+                self._save_centroid(conn, narrative_id, counts[narrative_id], sums[narrative_id])
+                if counts[narrative_id] <= 0:
+                    del sums[narrative_id], counts[narrative_id]
+                    ids.remove(narrative_id)
+        conn.execute("DELETE FROM members WHERE video_id = ?", (video_id,))
+
+    def add_video(self, video_id: str, statements, embeddings: np.ndarray) -> List[int]:
+        """
+        (Re)registers a video's low-truth statements and returns the narrative id of each.
+        Statements need text, timestamp and, if set, truthiness/severity attributes.
+        """
+        unit = _unit(np.asarray(embeddings, dtype=np.float32))
+        assigned = []
+        embedding_rows = self.embeddings.append(unit) if len(unit) else []
+        # centroid sums use the vectors as stored, so removing a video later subtracts exactly what was added
+        if embedding_rows:
+            unit = self.embeddings.get(embedding_rows, exact=True)
+        conn = self._connect()
+        self._lock.acquire()
+        try:
+            self._begin_write(conn)
+            # re-analysing a video replaces its previous contribution
+            self._remove_video(conn, video_id)
+            ids, counts, sums = self._load_centroids(conn)
+            ids = list(ids) # new narratives are appended below
+            centroids = _unit(np.stack([sums[i] for i in ids])) if ids else np.zeros((0, unit.shape[1]), dtype=np.float32)
+
+            for statement, e, embedding_row in zip(statements, unit, embedding_rows):
+                sims = centroids @ e
+                best = int(np.argmax(sims)) if len(ids) else -1
+                if best >= 0 and sims[best] >= self.spawn_threshold:
+                    narrative_id = ids[best]
+                    counts[narrative_id] += 1
+                    sums[narrative_id] += e
+                    centroids[best] = _unit(sums[narrative_id])
+                    self._save_centroid(conn, narrative_id, counts[narrative_id], sums[narrative_id])
+                else:
+                    cursor = conn.execute("INSERT INTO narratives (count, sum, version) VALUES (1, ?, (SELECT value FROM meta WHERE key = 'version'))", (e.tobytes(),))
+                    narrative_id = cursor.lastrowid
+                    ids.append(narrative_id)
+                    self._ids.append(narrative_id)
+                    counts[narrative_id] = 1
+                    sums[narrative_id] = e.copy()
+                    centroids = np.vstack([centroids, e[None, :]])
+
+                conn.execute(
+                    "INSERT INTO members (narrative_id, video_id, text, timestamp, truthiness, severity, embedding_row) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (narrative_id, video_id, statement.text, statement.timestamp, getattr(statement, "truthiness", None),
+                     getattr(statement, "severity", None), embedding_row)
+                )
+                assigned.append(narrative_id)
+
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('since_compaction', 0)")
+            conn.execute("UPDATE meta SET value = value + ? WHERE key = 'since_compaction'", (len(assigned),))
+            added = conn.execute("SELECT value FROM meta WHERE key = 'since_compaction'").fetchone()[0]
+            if added >= self.compact_every:
+                # claimed in this transaction, so only one worker starts a compaction
+                conn.execute("UPDATE meta SET value = 0 WHERE key = 'since_compaction'")
+            conn.execute("COMMIT")
+        except BaseException:
+            self._rollback(conn)
+            raise
+        finally:
+            self._lock.release()
+            conn.close()
+
+        if added >= self.compact_every:
+            self.compact_in_background()
+        return assigned
+
+    def compact_in_background(self):
+        """Runs compact() in a daemon thread, unless one is already running in this process."""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                print(f"Merged {self.compact()} narratives")
+            except Exception as e:
+                print(f"Narrative compaction failed: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="narrative-compaction", daemon=True).start()
+
+    def _merge_plan(self, ids: List[int], counts: Dict[int, int], sums: np.ndarray) -> Dict[int, List[int]]:
+        """
+        Which narratives each surviving narrative absorbs, largest first. Close pairs are found
+        blockwise, so memory stays O(COMPACT_BLOCK_ROWS x N) instead of a dense N x N matrix.
+        """
+        unit = _unit(sums)
+        neighbours = [[] for _ in ids]
+        for start in range(0, len(ids), COMPACT_BLOCK_ROWS):
+            block = unit[start:start + COMPACT_BLOCK_ROWS] @ unit.T
+            for a, b in zip(*np.nonzero(block >= self.merge_threshold)):
+                if start + a != b:
+                    neighbours[start + a].append(int(b))
+
+        alive = np.ones(len(ids), dtype=bool)
+        plan = {}
+        for a in sorted(range(len(ids)), key=lambda i: -counts[ids[i]]):
+            candidates = neighbours[a]
+            while alive[a] and candidates:
+                close = [b for b in candidates if alive[b] and b != a and unit[b] @ unit[a] >= self.merge_threshold]
+                if not close:
+                    break
+                for b in close:
+                    sums[a] += sums[b]
+                    alive[b] = False
+                    plan.setdefault(ids[a], []).append(ids[b])
+                # the merged centroid moved: refresh its row, it may now be close to others
+                unit[a] = _unit(sums[a])
+                candidates = list(np.flatnonzero((unit @ unit[a] >= self.merge_threshold) & alive))
+        return plan
+
+    def compact(self) -> int:
+        """Merges narratives whose centroids are closer than merge_threshold; returns how many were merged away."""
+        conn = self._connect()
+        try:
+            # plan against a snapshot without holding the write lock
+            with self._lock:
+                conn.execute("BEGIN")
+                ids, counts, sums = self._load_centroids(conn)
+                conn.execute("COMMIT")
+                ids, counts = list(ids), dict(counts)
+                totals = np.stack([sums[i] for i in ids]) if ids else None
+            plan = self._merge_plan(ids, counts, totals) if len(ids) > 1 else {}
+
+            merged = 0
+            with self._lock:
+                try:
+                    self._begin_write(conn)
+                    ids, counts, sums = self._load_centroids(conn)
+                    for a, absorbed in plan.items():
+                        for b in absorbed:
+                            # narratives may have moved or gone since the snapshot
+                            if a not in sums or b not in sums or _unit(sums[a]) @ _unit(sums[b]) < self.merge_threshold:
+                                continue
+                            sums[a] += sums.pop(b)
+                            counts[a] += counts.pop(b)
+                            ids.remove(b)
+                            conn.execute("UPDATE members SET narrative_id = ? WHERE narrative_id = ?", (a, b))
+                            conn.execute("DELETE FROM narratives WHERE id = ?", (b,))
+                            merged += 1
+                        if a in sums:
+                            self._save_centroid(conn, a, counts[a], sums[a])
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('since_compaction', 0)")
+                    conn.execute("COMMIT")
+                except BaseException:
+                    self._rollback(conn)
+                    raise
+        finally:
+            conn.close()
+        return merged
+
+    def nearest(self, embedding: np.ndarray) -> Optional[int]:
+        """Narrative id closest to `embedding`, or None if no narrative is within the spawn threshold."""
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("BEGIN")
+            ids, _, sums = self._load_centroids(conn)
+            conn.execute("COMMIT")
+            if not ids:
+                return None
+            centroids = np.stack([sums[i] for i in ids])
+            ids = list(ids)
+        sims = _unit(centroids) @ _unit(np.asarray(embedding, dtype=np.float32))
+        best = int(np.argmax(sims))
+        return ids[best] if sims[best] >= self.spawn_threshold else None
+
+    def narratives(self, limit: int = 50) -> List[dict]:
+        """Largest narratives first, with how many videos they span."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("""
+                SELECT n.id, n.count, COUNT(DISTINCT m.video_id) FROM narratives n JOIN members m ON m.narrative_id = n.id
+                GROUP BY n.id ORDER BY n.count DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [{"id": r[0], "statements": r[1], "videos": r[2]} for r in rows]
+
+    def statements(self, narrative_id: int, limit: int = 100, after_id: int = 0) -> List[NarrativeMember]:
+        """A page of a narrative's statements across videos, read straight off the narrative index."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, video_id, text, timestamp, truthiness, severity FROM members WHERE narrative_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (narrative_id, after_id, limit)
+            ).fetchall()
+        return [NarrativeMember(narrative_id, r[1], r[2], r[3], r[4], r[5], r[0]) for r in rows]
+
+    def similar(self, embedding: np.ndarray, k: int = 10) -> List[NarrativeMember]:
+        """The k statements across the corpus most similar to `embedding`, best first."""
+        # oversample, rows of re-analysed videos are orphaned in the append-only store
+        hits = self.embeddings.search(embedding, k * 2)
+        if not hits:
+            return []
+        rows = [row for row, _ in hits]
+        with closing(self._connect()) as conn:
+            found = conn.execute(
+                f"SELECT embedding_row, narrative_id, video_id, text, timestamp, truthiness, severity, id FROM members WHERE embedding_row IN ({','.join('?' * len(rows))})",
+                rows
+            ).fetchall()
+        by_row = {r[0]: NarrativeMember(*r[1:]) for r in found}
+        return [by_row[row] for row in rows if row in by_row][:k]
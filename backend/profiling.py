@@ -0,0 +1,84 @@
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+import cProfile
+import os
+import sys
+import threading
+import time
+
+"""
+Opt-in profiling of a single pipeline run.
+
+When enabled, the run is traced with cProfile (written as a .prof file for pstats/snakeviz)
+and, in parallel, its thread's stack is sampled on the wall clock, so time spent blocked on
+the network shows up too. The samples are written in collapsed-stack format (one
+"frame;frame;frame count" line per stack), ready for flamegraph.pl or speedscope. Both files
+are tagged with the video id. When disabled, profiled() does nothing.
+"""
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled(tag: str, enabled: bool = False, directory: Optional[str] = None):
+    """Profiles the enclosed block if `enabled`, writing <tag>-<time>.prof and .folded files."""
+    if not enabled:
+        yield
+        return
+
+    directory = PROFILE_DIR if directory is None else directory
+    os.makedirs(directory, exist_ok=True)
+    safe_tag = "".join(c if c.isalnum() or c in "-_" else "_" for c in tag)
+    base = os.path.join(directory, f"{safe_tag}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(base + ".prof")
+        sampler.write_collapsed(base + ".folded")
+        print(f"Profiled {tag} in {time.perf_counter() - started:.1f}s: {base}.prof, {base}.folded")
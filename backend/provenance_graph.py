@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+import numpy as np
+
+"""
+Indexed adjacency form of a provenance (article) DAG for paginated, lazily expanded queries.
+
+correlation_graph returns parallel node lists plus an edge list that can grow
+quadratically with the number of articles. Here the edges are stored once as a CSR
+adjacency (offsets + neighbour arrays, both directions) with every node's neighbours
+pre-sorted by severity and by time proximity, so "the k best edges of this node" is a
+slice. Node pages, top-k edge limits and neighbourhood expansion then only touch the
+nodes they return. Responses keep the DAG dict format the frontend already renders.
+"""
+
+RANKINGS = ("severity", "time")
+
+
+@dataclass
+class ProvenanceGraph:
+    ids: list
+    names: list
+    severity: list
+    urls: list
+    offsets: np.ndarray # neighbours of node i are in [offsets[i], offsets[i+1])
+    by_severity: np.ndarray
+    by_time: np.ndarray
+
+    @classmethod
+    def from_dag(cls, dag: dict) -> "ProvenanceGraph":
+        ids = list(dag.get("nodes", []))
+        n = len(ids)
+        position = {node: i for i, node in enumerate(ids)}
+        severity = list(dag.get("severity", []))
+        edges = np.array([(position[a], position[b]) for a, b in dag.get("edge", []) if a in position and b in position], dtype=np.int32).reshape(-1, 2)
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(offsets, src + 1, 1)
+        offsets = np.cumsum(offsets)
+
+        node_severity = np.array(severity + [0] * (n - len(severity)), dtype=np.float32)
+        # nodes are in timestamp order (correlation_graph sorts articles by time), so index distance is time proximity
+        proximity = np.abs(src - dst)
+        # lexsort sorts by the last key first
+        by_severity = dst[np.lexsort((proximity, -node_severity[dst], src))]
+        by_time = dst[np.lexsort((-node_severity[dst], proximity, src))]
+        return cls(ids, list(dag.get("nodename", [])), severity, list(dag.get("urls", [])), offsets, by_severity, by_time)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def degree(self, node: int) -> int:
+        return int(self.offsets[node + 1] - self.offsets[node])
+
+    def neighbours(self, node: int, rank: str = "severity") -> np.ndarray:
+        """All neighbours of the node at position `node`, best first by `rank`."""
+        ranked = self.by_time if rank == "time" else self.by_severity
+        return ranked[self.offsets[node]:self.offsets[node + 1]]
+
+    def subgraph(self, nodes: Iterable[int], k: Optional[int] = None, rank: str = "severity") -> dict:
+        """
+        The DAG dict restricted to node positions `nodes`, keeping each node's k best edges
+        to other included nodes (an edge survives if it is in either endpoint's top k).
+        """
+        nodes = sorted(set(nodes))
+        included = set(nodes)
+        edges = set()
+        for u in nodes:
+            kept = 0
+            for v in self.neighbours(u, rank):
+                if k is not None and kept >= k:
+                    break
+                if int(v) in included:
+                    edges.add((min(u, int(v)), max(u, int(v))))
+                    kept += 1
+
+        return {
+            "nodes": [self.ids[i] for i in nodes],
+            "nodename": [self.names[i] for i in nodes],
+            "severity": [self.severity[i] for i in nodes],
+            "urls": [self.urls[i] for i in nodes],
+            "edge": [[self.ids[a], self.ids[b]] for a, b in sorted(edges)],
+            # lets the client tell which nodes have neighbours left to expand
+            "degree": [self.degree(i) for i in nodes],
+            "total": len(self)
+        }
+
+    def page(self, offset: int = 0, limit: int = 50, k: Optional[int] = None, rank: str = "severity") -> dict:
+        """A page of nodes in timestamp order with the edges between them."""
+        offset = max(0, offset)
+        nodes = range(offset, min(len(self), offset + max(0, limit)))
+        result = self.subgraph(nodes, k, rank)
+        result["next_offset"] = nodes.stop if nodes.stop < len(self) else None
+        return result
+
+    def expand(self, node_id, depth: int = 1, k: Optional[int] = None, rank: str = "severity", limit: int = 50) -> Optional[dict]:
+        """
+        The neighbourhood within `depth` hops of node `node_id`, following each node's k best
+        edges, capped at `limit` nodes. Returns None if the node doesn't exist.
+        """
+        try:
+            start = self.ids.index(node_id)
+        except ValueError:
+            return None
+
+        seen: List[int] = [start]
+        visited = {start}
+        frontier = [start]
+        for _ in range(depth):
+            next_frontier = []
+            for u in frontier:
+                for v in self.neighbours(u, rank)[:k]:
+                    v = int(v)
+                    if v in visited or len(seen) >= limit:
+                        continue
+                    visited.add(v)
+                    seen.append(v)
+                    next_frontier.append(v)
+            frontier = next_frontier
+
+        result = self.subgraph(seen, k, rank)
+        result["center"] = node_id
+        return result
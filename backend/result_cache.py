@@ -0,0 +1,219 @@
+from collections import OrderedDict, defaultdict
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+"""
+Two-tier cache for finished video analyses.
+
+A small in-memory LRU sits in front of a size-capped directory on disk. Entries are
+keyed by YouTube video id, so the same video reached through different URLs shares
+one entry. When the disk tier grows past its byte budget the least recently used
+files are deleted. Request counts per video are accumulated in memory and added to
+a SQLite counter table every few seconds (and at exit), so every worker contributes
+to the same counts without a write per request. The most popular entries can then be
+pulled back into memory at startup. Hits/misses are counted per endpoint.
+
+Every set/invalidate bumps a per-key generation in the same SQLite file (a global one
+for "invalidate everything"), and memory hits are only served while their generation
+is current. Replacing or dropping an entry from one process (a CLI command, another
+worker) therefore reaches every other process on its next lookup.
+"""
+
+ALL_KEYS = "*" # generation bumped by invalidate() without a key
+
+POPULARITY_FLUSH_SECONDS = 30.0
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_memory_items: int = 16, max_disk_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._misses: Dict[str, int] = defaultdict(int)
+        self._db_path = os.path.join(cache_dir, "cache.sqlite3")
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._last_flush = time.monotonic()
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS popularity (key TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+        atexit.register(self.flush_popularity)
+
+    def _path(self, key: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+        return os.path.join(self.cache_dir, safe + ".pkl")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+
+    def _generation(self, key: str) -> tuple:
+        with closing(self._connect()) as conn:
+            rows = dict(conn.execute("SELECT key, generation FROM generations WHERE key IN (?, ?)", (key, ALL_KEYS)).fetchall())
+        return rows.get(key, 0), rows.get(ALL_KEYS, 0)
+
+    def _bump(self, key: str):
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT INTO generations (key, generation) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET generation = generation + 1", (key,))
+
+    def _remember(self, key: str, value: Any, generation: tuple):
+        self._memory[key] = (value, generation)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(path) # mark as recently used for disk eviction
+        return value
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        # read the generation before the file: a concurrent replace then shows up as stale next time
+        generation = self._generation(key)
+        if key in self._memory:
+            value, remembered = self._memory[key]
+            if remembered == generation:
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key] # replaced or invalidated by another process
+        value = self._read_disk(key)
+        if value is not None:
+            self._remember(key, value, generation)
+        return value
+
+    def get(self, key: str, endpoint: str = "", fallback: Optional[str] = None) -> Optional[Any]:
+        """Returns the entry for `key`, else the one for `fallback` if given; one hit or miss either way."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None and fallback is not None:
+                value = self._lookup(fallback)
+            if value is None:
+                self._misses[endpoint] += 1
+            else:
+                self._hits[endpoint] += 1
+            return value
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Like get(), but not counted in the hit/miss stats (for internal polling)."""
+        with self._lock:
+            return self._lookup(key)
+
+    def set(self, key: str, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._bump(key)
+            self._remember(key, value, self._generation(key))
+            self._evict_disk()
+
+    def touch(self, key: str):
+        """Counts a request for `key` towards its popularity."""
+        with self._lock:
+            self._pending[key] += 1
+            due = time.monotonic() - self._last_flush >= POPULARITY_FLUSH_SECONDS
+        if due:
+            self.flush_popularity()
+
+    def flush_popularity(self):
+        """Adds the request counts gathered since the last flush to the shared counter table."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with closing(self._connect()) as conn:
+                conn.executemany(
+                    "INSERT INTO popularity (key, count) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET count = count + excluded.count",
+                    pending.items()
+                )
+        except sqlite3.Error as e:
+            # popularity only steers warm-up, losing a batch of counts is fine
+            print(f"Error saving cache popularity: {e}")
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drops one entry from both tiers, or everything if no key is given."""
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+                paths = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith(".pkl")]
+            else:
+                self._memory.pop(key, None)
+                paths = [self._path(key)]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bump(ALL_KEYS if key is None else key)
+
+    def popular(self, limit: int) -> List[str]:
+        self.flush_popularity()
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT key FROM popularity ORDER BY count DESC LIMIT ?", (limit,)).fetchall()
+        return [r[0] for r in rows]
+
+    def warm(self, limit: Optional[int] = None) -> List[str]:
+        """Loads the most requested entries that are on disk into the memory tier."""
+        limit = self.max_memory_items if limit is None else limit
+        loaded = []
+        # least popular first so the most popular end up most recently used
+        for key in reversed(self.popular(limit)):
+            with self._lock:
+                if self._lookup(key) is not None:
+                    loaded.append(key)
+        return loaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint in set(self._hits) | set(self._misses):
+                hits, misses = self._hits[endpoint], self._misses[endpoint]
+                endpoints[endpoint] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+                }
+            return {
+                "memory_items": len(self._memory),
+                "endpoints": endpoints
+            }
@@ -2,10 +2,12 @@ from article_finder import Article
 
 from statement_extractor import Statement
 from dataclasses import dataclass
-from typing import List, Tuple
-from openai import OpenAI
+from typing import List, Optional, Tuple
 import json
+import time
 from correlation_graph import correlation_graph
+from evidence_packer import pack_text
+from call_stats import record_call
 
 
 @dataclass
@@ -34,12 +36,14 @@ We need to assess downstraem impact of the low-truth statement.
 We return a normalised float between 0 and 1.
 """
 def Agent(text: str) -> float:
+    from openai import OpenAI
     client = OpenAI()
+    started = time.perf_counter()
     response = client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are an expert at analyzing the severity and impact of misinformation."},
-            {"role": "user", "content": f"Analyze the severity and potential impact of this statement. Consider factors like reach, harm potential, and how misleading it is: {text}"}
+            {"role": "user", "content": f"Analyze the severity and potential impact of this statement. Consider factors like reach, harm potential, and how misleading it is: {pack_text(text, 'gpt-4o', site='severity_checker.agent')}"}
         ],
         functions=[{
             "name": "analyze_severity",
@@ -59,16 +63,17 @@ def Agent(text: str) -> float:
         }],
         function_call={"name": "analyze_severity"}
     )
+    record_call("severity.agent", "gpt-4o", time.perf_counter() - started)
     
     function_call_response = response.choices[0].message.function_call.arguments
     result = json.loads(function_call_response)
     return result["severity"]
     
-def check_severity(fact_checked_statements: List[Statement], article: List[List[Article]]) -> List[Tuple[float, OriginDAG]]:
+def check_severity(fact_checked_statements: List[Statement], article: List[List[Article]], max_pairs: Optional[int] = None) -> List[Tuple[float, OriginDAG]]:
     res = []
     for i, statement in enumerate(fact_checked_statements):
         severity = Agent(statement.text)
-        dag = correlation_graph(statement.text, article[i])
+        dag = correlation_graph(statement.text, article[i], max_pairs)
         res.append((severity, dag))
     return res
     # for each statement:
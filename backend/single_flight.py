@@ -0,0 +1,144 @@
+from concurrent.futures import Future
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+"""
+Single-flight coalescing of expensive computations.
+
+Within a process, concurrent callers for the same key attach to the first caller's
+Future and receive its result (or exception). Across processes (e.g. several gunicorn
+workers) the leader also takes a lease row in a local SQLite database; callers in
+other processes that find the lease held poll a shared lookup (the result cache)
+until the value appears, the lease is released or it expires. wait() joins a
+computation that is already running without ever starting one, e.g. to let a request
+reuse a related run under a different key.
+"""
+
+class SingleFlight:
+    def __init__(self, lease_db: str, lease_seconds: float = 600, poll_interval: float = 1.0):
+        self.lease_db = lease_db
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.lease_db, timeout=30, isolation_level=None)
+
+    def _acquire(self, key: str) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)", (key, self.owner, now + self.lease_seconds))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def _renew(self, key: str):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE leases SET expires = ? WHERE key = ? AND owner = ?", (time.time() + self.lease_seconds, key, self.owner))
+
+    def _release(self, key: str):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def _heartbeat(self, key: str, stop: threading.Event):
+        # keep the lease alive while a long computation is running
+        while not stop.wait(self.lease_seconds / 3):
+            self._renew(key)
+
+    def _lead(self, key: str, compute: Callable[[], Any], lookup: Callable[[], Optional[Any]]) -> Any:
+        while True:
+            if self._acquire(key):
+                stop = threading.Event()
+                threading.Thread(target=self._heartbeat, args=(key, stop), daemon=True).start()
+                try:
+                    # another process may have finished between our lookup and taking the lease
+                    value = lookup()
+                    return value if value is not None else compute()
+                finally:
+                    stop.set()
+                    self._release(key)
+
+            print(f"Waiting on analysis of {key} in another process")
+            while True:
+                time.sleep(self.poll_interval)
+                value = lookup()
+                if value is not None:
+                    return value
+                if self._acquire(key):
+                    # lease released or expired without a result, take over (we now own it)
+                    break
+
+    def wait(self, key: str, lookup: Callable[[], Optional[Any]], timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Waits (at most `timeout` seconds) for a computation of `key` that is already in flight,
+        here or in another process, and returns its value. Returns None if nothing was in
+        flight, it failed or it didn't finish in time; it never computes anything itself.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None:
+            print(f"Joining in-flight analysis of {key}")
+            try:
+                return future.result(timeout)
+            except Exception:
+                return None
+
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] == self.owner or row[1] <= time.time():
+            return None
+        print(f"Joining analysis of {key} in another process")
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while give_up is None or time.monotonic() < give_up:
+            time.sleep(self.poll_interval if give_up is None else max(0.0, min(self.poll_interval, give_up - time.monotonic())))
+            value = lookup()
+            if value is not None:
+                return value
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] <= time.time():
+                return lookup()
+        return None
+
+    def do(self, key: str, compute: Callable[[], Any], lookup: Callable[[], Optional[Any]] = lambda: None) -> Any:
+        """
+        Returns compute() for `key`, running it at most once at a time across threads and
+        processes. `lookup` should return the finished value from shared storage, or None.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            print(f"Attaching to in-flight analysis of {key}")
+            return future.result()
+
+        try:
+            future.set_result(self._lead(key, compute, lookup))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result()
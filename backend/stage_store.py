@@ -0,0 +1,130 @@
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import orjson
+
+"""
+Persistent per-stage outputs for incremental re-analysis.
+
+Every pipeline stage stores its output under (stage, key) together with a hash of the
+inputs it was computed from. A stored output is reused while its inputs hash still
+matches and it is younger than the stage's max age (None means it never expires).
+Because downstream stages hash the outputs of upstream ones, refreshing a stale node
+(e.g. 24h old search results) only recomputes the stages whose inputs actually changed.
+The same database keeps cumulative per-(stage, model) call counts and latency, and how
+many claims the verification cascade routed each way.
+"""
+
+@dataclass
+class StageRecord:
+    value: Any
+    inputs_hash: str
+    created: float
+
+
+def inputs_hash(inputs: Any) -> str:
+    data = orjson.dumps(inputs, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS, default=repr)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class StageStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS stages (stage TEXT NOT NULL, key TEXT NOT NULL, inputs_hash TEXT NOT NULL, created REAL NOT NULL, value BLOB NOT NULL, PRIMARY KEY (stage, key))")
+            conn.execute("CREATE INDEX IF NOT EXISTS stages_created ON stages (stage, created)")
+            conn.execute("CREATE TABLE IF NOT EXISTS call_latency (stage TEXT NOT NULL, model TEXT NOT NULL, calls INTEGER NOT NULL, seconds REAL NOT NULL, PRIMARY KEY (stage, model))")
+            conn.execute("CREATE TABLE IF NOT EXISTS verify_routes (route TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, stage: str, key: str) -> Optional[StageRecord]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value, inputs_hash, created FROM stages WHERE stage = ? AND key = ?", (stage, key)).fetchone()
+        if row is None:
+            return None
+        try:
+            return StageRecord(value=pickle.loads(row[0]), inputs_hash=row[1], created=row[2])
+        except Exception:
+            return None
+
+    def put(self, stage: str, key: str, hashed_inputs: str, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO stages (stage, key, inputs_hash, created, value) VALUES (?, ?, ?, ?, ?)", (stage, key, hashed_inputs, time.time(), data))
+
+    def invalidate(self, stage: Optional[str] = None, key: Optional[str] = None):
+        with self._lock, closing(self._connect()) as conn:
+            if stage is None:
+                conn.execute("DELETE FROM stages")
+            elif key is None:
+                conn.execute("DELETE FROM stages WHERE stage = ?", (stage,))
+            else:
+                conn.execute("DELETE FROM stages WHERE stage = ? AND key = ?", (stage, key))
+
+    def prune(self, max_ages: Dict[str, float]) -> int:
+        """Deletes stored outputs older than their stage's max age; returns how many were removed."""
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            return sum(conn.execute("DELETE FROM stages WHERE stage = ? AND created < ?", (stage, now - max_age)).rowcount
+                       for stage, max_age in max_ages.items())
+
+    def record_calls(self, timings: Dict[Tuple[str, str], Tuple[int, float]]):
+        """Adds (stage, model) -> (calls, seconds) to the cumulative call latency history."""
+        if not timings:
+            return
+        with self._lock, closing(self._connect()) as conn:
+            conn.executemany(
+                "INSERT INTO call_latency (stage, model, calls, seconds) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (stage, model) DO UPDATE SET calls = calls + excluded.calls, seconds = seconds + excluded.seconds",
+                [(stage, model, calls, seconds) for (stage, model), (calls, seconds) in timings.items()]
+            )
+
+    def call_latency(self) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        """Cumulative (stage, model) -> (calls, seconds) over every recorded analysis."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT stage, model, calls, seconds FROM call_latency").fetchall()
+        return {(r[0], r[1]): (r[2], r[3]) for r in rows}
+
+    def record_routes(self, routes: Dict[str, int]):
+        """Adds route -> claims to the cumulative verification cascade routing counts."""
+        if not routes:
+            return
+        with self._lock, closing(self._connect()) as conn:
+            conn.executemany(
+                "INSERT INTO verify_routes (route, count) VALUES (?, ?) ON CONFLICT (route) DO UPDATE SET count = count + excluded.count",
+                list(routes.items())
+            )
+
+    def verify_routes(self) -> Dict[str, int]:
+        """Cumulative route -> claims (fast, escalated_band, escalated_vague, strong_only) over every recorded analysis."""
+        with closing(self._connect()) as conn:
+            return dict(conn.execute("SELECT route, count FROM verify_routes").fetchall())
+
+    @staticmethod
+    def is_fresh(record: Optional[StageRecord], hashed_inputs: str, max_age: Optional[float] = None) -> bool:
+        if record is None or record.inputs_hash != hashed_inputs:
+            return False
+        return max_age is None or time.time() - record.created < max_age
+
+    def cached(self, stage: str, key: str, inputs: Any, compute: Callable[[], Any], max_age: Optional[float] = None) -> Any:
+        """Returns the stored output if still fresh for `inputs`, otherwise computes and stores it."""
+        hashed = inputs_hash(inputs)
+        record = self.get(stage, key)
+        if self.is_fresh(record, hashed, max_age):
+            return record.value
+
+        print(f"[{stage}] recomputing {key[:60]}")
+        value = compute()
+        if value is not None:
+            self.put(stage, key, hashed, value)
+        return value
@@ -1,18 +1,10 @@
-from article_finder import find_articles
-from fact_checker import fact_check
-from severity_checker import check_severity
-
-from statement_extractor import Statement, extract_statements
+from statement_extractor import Statement
+from evidence_packer import pack_text
+from call_stats import record_call
 from dataclasses import dataclass
-from typing import List
-from sklearn.cluster import KMeans
+from typing import List, Optional
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE
-import matplotlib
-matplotlib.use('Agg')  # Non-GUI backend
-import matplotlib.pyplot as plt
-from openai import OpenAI
+import time
 
 @dataclass
 class Misinformation:
@@ -20,6 +12,48 @@ class Misinformation:
     summary: str
     severity: float
     truthiness: float
+    embeddings: Optional[np.ndarray] = None # (n_statements, embedding_dim), row-aligned with statements
+    centroid: Optional[np.ndarray] = None # mean embedding of the cluster
+
+
+def embed_texts(texts: List[str], model: str = "text-embedding-3-small") -> np.ndarray:
+    """Embeds all texts in a single API call, returning shape (n_texts, embedding_dim)."""
+    from openai import OpenAI
+    client = OpenAI()
+    started = time.perf_counter()
+    response = client.embeddings.create(input=[text.replace("\n", " ") for text in texts], model=model)
+    record_call("embeddings", model, time.perf_counter() - started)
+    return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+def similarity_edges(vectors: np.ndarray, top_k: int = 2, threshold: float = 0.5) -> List[List[int]]:
+    """
+    Returns sparse undirected edges [i, j] (i < j) between rows of `vectors`.
+
+    Each row keeps its `top_k` most cosine-similar neighbours whose similarity is at least
+    `threshold`. Everything is done on one similarity matrix, no per-pair loops or API calls.
+    """
+    n = 0 if vectors is None else len(vectors)
+    if n < 2 or top_k <= 0:
+        return []
+
+    #normalise rows so the gram matrix is cosine similarity
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    sims = unit @ unit.T
+    np.fill_diagonal(sims, -np.inf)
+
+    #keep the top-k entries of each row, then apply the threshold
+    k = min(top_k, n - 1)
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    keep = np.zeros_like(sims, dtype=bool)
+    np.put_along_axis(keep, top, True, axis=1)
+    keep &= sims >= threshold
+
+    #symmetrise and read off the upper triangle
+    keep |= keep.T
+    rows, cols = np.nonzero(np.triu(keep, k=1))
+    return [[int(i), int(j)] for i, j in zip(rows, cols)]
 
 """
 We take in our list of truth scores and severity scores and statements and produce an aggregate misinformation list.
@@ -29,23 +63,23 @@ them with each other. We can then cluster them using KMeans for example, and pro
 The final truthiness and severity scores should be aggregated by doing batch averages over the clusters.
 Summaries can be generated using an LLM.
 """
-def aggregate_statements(statements: List[Statement], truth_scores: List[float], severity_scores: List[float]) -> List[Misinformation]:
-    client = OpenAI()
+def aggregate_statements(statements: List[Statement], truth_scores: List[float], severity_scores: List[float], embeddings: Optional[np.ndarray] = None) -> List[Misinformation]:
+    # heavy dependencies are only needed once we actually cluster
+    from openai import OpenAI
+    from sklearn.cluster import KMeans
+    from sklearn.manifold import TSNE
+    import matplotlib
+    matplotlib.use('Agg')  # Non-GUI backend
+    import matplotlib.pyplot as plt
 
-    # Get embeddings as numpy arrays
-    def get_embedding(text, model="text-embedding-3-small"):
-        text = text.replace("\n", " ")
-        response = client.embeddings.create(input=[text], model=model)
-        # Return as numpy array
-        return np.array(response.data[0].embedding, dtype=np.float32)
+    client = OpenAI()
 
     #extract texts from statements
     statements_text = [statement.text for statement in statements]
 
-    #get embeddings as a list of arrays and stack them into a 2D array
-    embeddings_list = [get_embedding(statement.text, model='text-embedding-3-small') for statement in statements]
+    #reuse embeddings computed upstream, otherwise embed all statements in one call
     #shape: (n_statements, embedding_dim)
-    embeddings_np = np.array(embeddings_list)
+    embeddings_np = embeddings if embeddings is not None else embed_texts(statements_text)
 
     #determine number of clusters (using elbow method)
     max_clusters = min(len(statements), 8)
@@ -101,31 +135,41 @@ def aggregate_statements(statements: List[Statement], truth_scores: List[float],
         #filter statements based on cluster membership
         cluster_statements = [s for s, m in zip(statements, cluster_mask) if m]
         #filter the truth and severity scores and compute the averages using numpy
+        cluster_embeddings = embeddings_np[cluster_mask]
         cluster_truths = truth_scores_array[cluster_mask]
         cluster_severities = severity_scores_array[cluster_mask]
 
         #combine texts from the statements in the current cluster for summarization
         cluster_texts = " ".join([s.text for s in cluster_statements])
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Summarize these related statements into a concise 3-6 word summary."},
-                {"role": "user", "content": cluster_texts}
+                {"role": "user", "content": pack_text(cluster_texts, "gpt-4o", site="statement_aggregator.summary")}
             ]
         )
+        record_call("aggregate.summary", "gpt-4o", time.perf_counter() - started)
         summary = response.choices[0].message.content
 
         misinformation = Misinformation(
             statements=cluster_statements,
             summary=summary,
             severity=float(cluster_severities.mean()) if len(cluster_severities) > 0 else 0.0,
-            truthiness=float(cluster_truths.mean()) if len(cluster_truths) > 0 else 0.0
+            truthiness=float(cluster_truths.mean()) if len(cluster_truths) > 0 else 0.0,
+            embeddings=cluster_embeddings,
+            centroid=kmeans.cluster_centers_[cluster_id]
         )
         misinformation_list.append(misinformation)
 
     return misinformation_list
 
 if __name__ == "__main__":
+    from article_finder import find_articles
+    from fact_checker import fact_check
+    from severity_checker import check_severity
+    from statement_extractor import extract_statements
+
     #extract statements from a source URL
     statements = extract_statements("https://www.youtube.com/watch?v=ShRYdYTtIx8")
     truth_scores = fact_check(statements)
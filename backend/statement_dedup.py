@@ -0,0 +1,60 @@
+from statement_extractor import Statement
+from statement_aggregator import embed_texts
+from typing import List, Optional, Tuple
+import numpy as np
+
+"""
+Collapse near-duplicate statements before they are fact-checked.
+
+Repetitive videos and overlapping transcript chunks often yield the same claim in
+slightly different words. We embed every extracted statement, and each statement
+joins the first earlier statement whose cosine similarity is above a threshold.
+Only one representative per group goes through verification, and its verdict is
+fanned back out to every member (each keeps its own timestamp).
+"""
+
+def group_near_duplicates(embeddings: np.ndarray, threshold: float = 0.92) -> List[int]:
+    """Returns, for every row, the index of the row representing its group (itself if it leads one)."""
+    n = len(embeddings)
+    if n == 0:
+        return []
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms == 0, 1, norms)
+    #only look back at earlier statements, so the earliest occurrence leads its group
+    similar = np.tril(unit @ unit.T >= threshold, k=-1)
+
+    leader = list(range(n))
+    for i in range(n):
+        candidates = np.flatnonzero(similar[i])
+        for j in candidates:
+            if leader[j] == j:
+                leader[i] = int(j)
+                break
+    return leader
+
+
+def collapse_near_duplicates(statements: List[Statement], threshold: float = 0.92, embeddings: Optional[np.ndarray] = None) -> Tuple[List[Statement], List[int], np.ndarray]:
+    """
+    Returns (representatives, membership, embeddings) where membership[i] is the index in
+    `representatives` that statement i is verified by, and embeddings are row-aligned with
+    `statements` so later stages can reuse them. Pass `embeddings` to skip the embedding call.
+    """
+    if not statements:
+        return [], [], np.zeros((0, 0), dtype=np.float32)
+
+    if embeddings is None:
+        embeddings = embed_texts([s.text for s in statements])
+    leader = group_near_duplicates(embeddings, threshold)
+
+    representatives = []
+    rep_index = {}
+    for i, l in enumerate(leader):
+        if l == i:
+            rep_index[i] = len(representatives)
+            representatives.append(statements[i])
+    membership = [rep_index[l] for l in leader]
+
+    if len(representatives) < len(statements):
+        print(f"Collapsed {len(statements)} statements into {len(representatives)} groups")
+    return representatives, membership, embeddings
@@ -1,20 +1,46 @@
 from dataclasses import dataclass
-from typing import List
-from youtube_transcript_api import YouTubeTranscriptApi
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from openai import OpenAI
+from typing import List, Optional
+from urllib.parse import urlparse, parse_qs
 import re
 import json
 import os
+import time
 from dotenv import load_dotenv
+from evidence_packer import pack_text
+from call_stats import record_call
 
 load_dotenv()
 
+TRANSCRIPT_TOKEN_BUDGET = 100000
+
 @dataclass
 class Statement:
     text: str
     timestamp: str
+    priority: int = 0 # rank in the extractor's output, 0 is the most controversial
+
+
+def video_id_from_url(youtube_url: str) -> str:
+    """
+    Normalises the many shapes of YouTube links to the bare video id, e.g.
+    watch?v=ID&t=4s, youtu.be/ID?t=4, /shorts/ID, /embed/ID, /live/ID.
+    """
+    url = youtube_url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    parts = [p for p in parsed.path.split("/") if p]
+
+    if host.endswith("youtu.be") and parts:
+        return parts[0]
+    ids = parse_qs(parsed.query).get("v")
+    if ids and ids[0]:
+        return ids[0].strip()
+    if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+        return parts[1]
+    # not a URL we recognise, fall back to the raw string
+    return youtube_url.strip()
 
 
 """
@@ -31,6 +57,8 @@ def video(video_id):
     print(f"Fetching transcript for video: {video_id}")
     
     try:
+        from youtube_transcript_api import YouTubeTranscriptApi
+
         # create YouTubeTranscriptApi instance
         ytt_api = YouTubeTranscriptApi()
         fetched_transcript = ytt_api.fetch(video_id, languages=['en', 'en-US', 'en-GB'])
@@ -58,19 +86,24 @@ def format_transcript_data(fetched_transcript):
     
     return data
 
-def extract_statements(youtube_video_url: str) -> List[Statement]:
+def extract_statements(youtube_video_url: str, transcript: Optional[List[tuple]] = None) -> List[Statement]:
     # Extract video ID, handling URLs with additional parameters like &t=4s
-    video_id = youtube_video_url.split("v=")[1].split("&")[0]
+    video_id = video_id_from_url(youtube_video_url)
 
-    ls = video(video_id) #get the transcript data
+    ls = transcript if transcript is not None else video(video_id) #get the transcript data
    
     str = ""
     for i in range(len(ls)):
         str = str + ls[i][1] + " "
 
 
+    from openai import OpenAI
     client = OpenAI()
+
+    # gpt-4o has a 128k context, leave room for the instructions and the extracted list
+    transcript = pack_text(str, "gpt-4o", site="statement_extractor.transcript", budget=TRANSCRIPT_TOKEN_BUDGET)
     
+    started = time.perf_counter()
     response = client.chat.completions.create(
         model="gpt-4o",
         # messages=[
@@ -98,7 +131,7 @@ def extract_statements(youtube_video_url: str) -> List[Statement]:
             - If the statement lacks context, **add minimal necessary clarification** in the 'Clarified' field
 
             Now extract the top statements from this transcript:
-            {str}
+            {transcript}
             """}
         ],
         functions=[{
@@ -130,6 +163,7 @@ def extract_statements(youtube_video_url: str) -> List[Statement]:
         }],
         function_call={"name": "extract_statements"}
     )
+    record_call("statements", "gpt-4o", time.perf_counter() - started)
 
     #get statements from LLM response
     function_call_response = response.choices[0].message.function_call.arguments
@@ -146,8 +180,8 @@ def extract_statements(youtube_video_url: str) -> List[Statement]:
             seen.add(s)
             unique_statements.append(s)
             pos = str.find(s)
-            # Store (original_text, pos, clarified_text) together
-            statements_with_positions.append((s, pos, statements_clarified[i]))
+            # Store (original_text, pos, clarified_text, priority) together
+            statements_with_positions.append((s, pos, statements_clarified[i], i))
 
     statements_with_positions.sort(key=lambda x: x[1])
     #cap at 15 statements for testing purposes
@@ -165,7 +199,7 @@ def extract_statements(youtube_video_url: str) -> List[Statement]:
             if (id == len(statements_with_positions)):
                 break
         if (len(acc) > statements_with_positions[id][1]):
-            statements_with_timestamps.append(Statement(statements_clarified[id], QwQ[0]))
+            statements_with_timestamps.append(Statement(statements_clarified[id], QwQ[0], statements_with_positions[id][3]))
             id += 1
             if (id == len(statements_with_positions)):
                 break